@@ -66,6 +66,7 @@ def get_SIU_fdn_list_from_SMO(logger, siu_fdn_black_list=[]):
 
 def get_SIU_data(siu_fdn_list, logger, ping_check=True):
     """Take as input a list of SIU FDNs and get from cstest its IP
+    Return a list of dicts {'siu_name', 'siu_ip', 'siu_fdn'}
     Optionally, do a ping to the SIU. It it does not respond, exclude it from the result
     """
 
@@ -108,6 +109,7 @@ def get_SIU_data(siu_fdn_list, logger, ping_check=True):
                         SIU_dict = {}
                         SIU_dict['siu_name'] = SIU_name
                         SIU_dict['siu_ip'] = SIU_ipAddress
+                        SIU_dict['siu_fdn'] = SIU_fdn
 
                         SIU_dict_list.append(SIU_dict)
                 else:
@@ -115,6 +117,7 @@ def get_SIU_data(siu_fdn_list, logger, ping_check=True):
                     SIU_dict = {}
                     SIU_dict['siu_name'] = SIU_name
                     SIU_dict['siu_ip'] = SIU_ipAddress
+                    SIU_dict['siu_fdn'] = SIU_fdn
 
                     SIU_dict_list.append(SIU_dict)
 
@@ -0,0 +1,441 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+__author__ = 'Esteban Garcia-Gurtubay'
+__version__ = 'R13A01'
+__date__ = '19/10/2026 16:25:10'
+
+
+# Description     : Record/replay of SIU shell channels, for deterministic performance regression tests
+# Usage           : python siu_cassette.py -h
+#                   Record: SIU_Wrapper(logger, record_dir='cassettes') saves a cassette per SIU session
+#                   Replay: SIU_Wrapper(logger, replay_cassette='cassettes/x.cassette', replay_speed=0)
+#
+#                   A cassette is a gzipped JSON document:
+#                   {'version', 'siu_ip', 'siu_user', 'record_time',
+#                    'events': [[kind, time_offset, data], ...]}
+#                   kind is 's' (sent by us), 'r' (received from the SIU) or 'x' (receive timeout)
+
+import gzip
+import json
+import logging
+import os
+import socket
+import sys
+import time
+
+# Constants
+CASSETTE_VERSION = 1
+CASSETTE_EXTENSION = '.cassette'
+
+try:
+    import tracemalloc # Only in Python 3.4+
+except ImportError:
+    tracemalloc = None
+
+try:
+    import resource # Only in UNIX
+except ImportError:
+    resource = None
+
+
+def get_cpu_time():
+    """Return the CPU time (user + system) of this process, in seconds"""
+
+    if hasattr(time, 'process_time'):
+        # Python 3.3+. Better resolution than os.times()
+        return time.process_time()
+
+    process_times = os.times()
+    return process_times[0] + process_times[1]
+
+
+def get_max_rss():
+    """Return the peak resident memory of this process so far, in bytes, or None if it is not available"""
+
+    if resource is None:
+        return None
+
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':
+        # Linux reports kilobytes, Mac OS X bytes
+        max_rss *= 1024
+    return max_rss
+
+
+def to_cassette_data(channel_data):
+    """Convert the data of a channel into text for the cassette, keeping every byte"""
+
+    if isinstance(channel_data, bytes):
+        return channel_data.decode('latin-1')
+    return channel_data
+
+
+def to_channel_data(cassette_data):
+    """Convert the text of a cassette into the data type that the channel returns (str)"""
+
+    if bytes is str:
+        # Python 2
+        return cassette_data.encode('latin-1')
+    return cassette_data
+
+
+class Recording_Channel(object):
+    """A proxy for a paramiko Channel that records the byte stream and its timing
+
+    Consecutive received bytes that arrive within coalesce_window seconds are stored as one event,
+    to keep the cassettes compact. Only the chunks of the last event are kept in a list. They are joined
+    when the next event starts. The cassette is saved when the channel is closed
+    """
+
+    def __init__(self, chan, cassette_filename, siu_ip=None, siu_user=None, coalesce_window=0.001):
+        self.chan = chan
+        self.cassette_filename = cassette_filename
+        self.coalesce_window = coalesce_window
+        self.header_dict = {'version': CASSETTE_VERSION, 'siu_ip': siu_ip, 'siu_user': siu_user,
+                            'record_time': time.strftime('%Y-%m-%d %H:%M:%S')}
+        self.event_list = []
+        self.chunk_list = [] # The data of the last event, not joined yet
+        self.last_recv_time = None
+        self.start_time = time.time()
+        self.saved = False
+
+
+    def __getattr__(self, name):
+        # Anything not recorded goes straight to the real channel
+        return getattr(self.chan, name)
+
+
+    def add_event(self, kind, data):
+        """Record an event, or add the data to the last one if both are coalesced receives"""
+
+        now = time.time()
+        if (kind == 'r' and self.event_list and self.event_list[-1][0] == 'r' and
+                now - self.last_recv_time <= self.coalesce_window):
+            self.chunk_list.append(to_cassette_data(data))
+            if len(self.chunk_list) >= 1024:
+                # A long response read a byte at a time. Do not keep a string per byte
+                self.chunk_list = [''.join(self.chunk_list)]
+        else:
+            self.end_event()
+            self.event_list.append([kind, round(now - self.start_time, 6), ''])
+            self.chunk_list = [to_cassette_data(data)]
+
+        if kind == 'r':
+            self.last_recv_time = now
+
+
+    def end_event(self):
+        """Join the chunks of the last event into its data"""
+
+        if self.event_list:
+            self.event_list[-1][2] = ''.join(self.chunk_list)
+        self.chunk_list = []
+
+
+    def send(self, data):
+        result = self.chan.send(data)
+        self.add_event('s', data)
+        return result
+
+
+    def recv(self, nbytes):
+        try:
+            data = self.chan.recv(nbytes)
+        except socket.timeout:
+            self.add_event('x', '')
+            raise
+
+        self.add_event('r', data)
+        return data
+
+
+    def close(self):
+        self.chan.close()
+        self.save()
+
+
+    def save(self):
+        """Write the cassette file, once"""
+
+        if self.saved:
+            return
+
+        self.end_event()
+        cassette_dict = dict(self.header_dict)
+        cassette_dict['events'] = self.event_list
+        with gzip.open(self.cassette_filename, 'wb') as cassette_file:
+            cassette_file.write(json.dumps(cassette_dict).encode('utf-8'))
+        self.saved = True
+
+
+def load_cassette(cassette_filename):
+    """Return the cassette dict stored in a cassette file"""
+
+    with gzip.open(cassette_filename, 'rb') as cassette_file:
+        return json.loads(cassette_file.read().decode('utf-8'))
+
+
+class Replay_Channel(object):
+    """A fake paramiko Channel that feeds a recorded cassette back
+
+    The SIU response delays are kept relative to our last sent string, and divided by speed.
+    speed=0 means no delays at all. Sent strings are not checked, but mismatches are counted
+    """
+
+    def __init__(self, cassette_filename, speed=1.0, logger=None):
+        self.cassette_dict = load_cassette(cassette_filename)
+        self.event_list = self.cassette_dict['events']
+        self.speed = speed
+        self.logger = logger or logging.getLogger(__name__)
+
+        self.closed = False
+        self.timeout = None
+        self.event_index = 0
+        self.pending_data = ''
+        self.pending_position = 0
+        self.send_mismatch_count = 0
+
+        # The replay times are anchored to our last send
+        self.anchor_real_time = time.time()
+        self.anchor_offset = 0.0
+
+
+    def settimeout(self, timeout):
+        self.timeout = timeout
+
+
+    def send(self, data):
+        if self.closed:
+            raise socket.error('Replay channel is closed')
+
+        data = to_cassette_data(data)
+
+        # Move to the next recorded send, dropping any received data not read yet
+        while self.event_index < len(self.event_list) and self.event_list[self.event_index][0] != 's':
+            self.event_index += 1
+        self.pending_data = ''
+        self.pending_position = 0
+
+        if self.event_index < len(self.event_list):
+            kind, time_offset, recorded_data = self.event_list[self.event_index]
+            if recorded_data != data:
+                self.send_mismatch_count += 1
+                self.logger.warning('Replay send mismatch: %s recorded, %s sent' % (repr(recorded_data), repr(data)))
+            self.anchor_offset = time_offset
+            self.event_index += 1
+        else:
+            self.send_mismatch_count += 1
+            self.logger.warning('Replay send after the end of the cassette: %s' % repr(data))
+
+        self.anchor_real_time = time.time()
+        return len(data)
+
+
+    def recv(self, nbytes):
+        if self.pending_position >= len(self.pending_data):
+            if self.event_index >= len(self.event_list) or self.event_list[self.event_index][0] == 's':
+                # Nothing more was received before our next send in the recording
+                raise socket.timeout('No more data in the cassette before the next send')
+
+            kind, time_offset, recorded_data = self.event_list[self.event_index]
+            self.event_index += 1
+
+            if self.speed > 0:
+                delay = self.anchor_real_time + (time_offset - self.anchor_offset) / self.speed - time.time()
+                if delay > 0:
+                    time.sleep(delay)
+
+            if kind == 'x':
+                raise socket.timeout('Recorded timeout')
+
+            self.pending_data = recorded_data
+            self.pending_position = 0
+
+        data = self.pending_data[self.pending_position:self.pending_position + nbytes]
+        self.pending_position += len(data)
+        return to_channel_data(data)
+
+
+    def close(self):
+        self.closed = True
+
+
+def get_recorded_command_list(cassette_dict):
+    """Return the commands sent in a recorded session, in order, without the final exit"""
+
+    command_list = []
+    for kind, time_offset, data in cassette_dict['events']:
+        if kind == 's':
+            command = data.rstrip('\r\n')
+            if command.strip() != '' and command.strip() != 'exit':
+                command_list.append(command)
+
+    return command_list
+
+
+def replay_session(cassette_filename, logger, speed=0):
+    """Replay a recorded SIU session through SIU_Wrapper. Return its list of siu_command_result_dicts"""
+
+    from pysiu import siu_wrapper # Imported here, as siu_wrapper imports this module
+
+    cassette_dict = load_cassette(cassette_filename)
+    siuw = siu_wrapper.SIU_Wrapper(logger, replay_cassette=cassette_filename, replay_speed=speed)
+
+    siu_command_result_dict_list = [siuw.SIU_login(cassette_dict.get('siu_ip'), cassette_dict.get('siu_user'), None)]
+    if siu_command_result_dict_list[-1]['cmd_success']:
+        siu_command_result_dict_list.append(siuw.SIU_wait_for_prompt())
+        if siu_command_result_dict_list[-1]['cmd_success']:
+            siu_command_result_dict_list += siuw.SIU_run_command_list(get_recorded_command_list(cassette_dict),
+                                                                      cassette_dict.get('siu_user'))
+    siuw.SIU_close_channel()
+
+    return siu_command_result_dict_list
+
+
+def benchmark_cassette(cassette_filename, logger, speed=0, repeat=3):
+    """Measure the cost of replaying a cassette through SIU_Wrapper
+
+    Return a dict {'cpu_time', 'wall_time', 'peak_alloc', 'alloc_source'}, with the best of repeat runs.
+    CPU times are in seconds. peak_alloc is in bytes, and alloc_source tells how it was measured:
+    'tracemalloc'   The peak of the bytes allocated by Python during the run (Python 3.4+)
+    'maxrss'        The growth of the peak resident memory of the process during the run (Python 2).
+                    It only grows when a run goes past the previous peak, so the worst run is kept
+    None            No measure available (peak_alloc is None)
+    """
+
+    if tracemalloc is not None:
+        alloc_source = 'tracemalloc'
+    elif get_max_rss() is not None:
+        alloc_source = 'maxrss'
+    else:
+        alloc_source = None
+
+    metric_dict = {'cpu_time': None, 'wall_time': None, 'peak_alloc': None, 'alloc_source': alloc_source}
+    for count in range(repeat):
+        if alloc_source == 'tracemalloc':
+            tracemalloc.start()
+        elif alloc_source == 'maxrss':
+            start_max_rss = get_max_rss()
+
+        start_cpu_time = get_cpu_time()
+        start_wall_time = time.time()
+        replay_session(cassette_filename, logger, speed)
+
+        cpu_time = get_cpu_time() - start_cpu_time
+        wall_time = time.time() - start_wall_time
+
+        if alloc_source == 'tracemalloc':
+            peak_alloc = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            if metric_dict['peak_alloc'] is None or peak_alloc < metric_dict['peak_alloc']:
+                metric_dict['peak_alloc'] = peak_alloc
+        elif alloc_source == 'maxrss':
+            peak_alloc = get_max_rss() - start_max_rss
+            if metric_dict['peak_alloc'] is None or peak_alloc > metric_dict['peak_alloc']:
+                metric_dict['peak_alloc'] = peak_alloc
+
+        if metric_dict['cpu_time'] is None or cpu_time < metric_dict['cpu_time']:
+            metric_dict['cpu_time'] = cpu_time
+        if metric_dict['wall_time'] is None or wall_time < metric_dict['wall_time']:
+            metric_dict['wall_time'] = wall_time
+
+    return metric_dict
+
+
+def run_regression(cassette_dir, baseline_filename, logger, speed=0, repeat=3, tolerance=0.2, update_baseline=False):
+    """Benchmark every cassette in cassette_dir and compare the results with the baseline file
+
+    A cassette regresses when its CPU time or peak allocation grows more than tolerance (e.g. 0.2 = 20%).
+    Return the tuple (current_dict, regression_dict_list), with the metrics per cassette and the
+    regressions as dicts {'cassette', 'metric', 'baseline', 'current'}
+    """
+
+    if os.path.exists(baseline_filename):
+        with open(baseline_filename) as baseline_file:
+            baseline_dict = json.load(baseline_file)
+    else:
+        baseline_dict = {}
+
+    regression_dict_list = []
+    current_dict = {}
+    for cassette_filename in sorted(os.listdir(cassette_dir)):
+        if not cassette_filename.endswith(CASSETTE_EXTENSION):
+            continue
+
+        metric_dict = benchmark_cassette(os.path.join(cassette_dir, cassette_filename), logger, speed, repeat)
+        current_dict[cassette_filename] = metric_dict
+
+        baseline_metric_dict = baseline_dict.get(cassette_filename, {})
+        for metric in ('cpu_time', 'peak_alloc'):
+            if metric == 'peak_alloc' and baseline_metric_dict.get('alloc_source', 'tracemalloc') != metric_dict['alloc_source']:
+                # Measured in another way (e.g. the baseline was made with Python 3). Not comparable
+                continue
+
+            baseline_value = baseline_metric_dict.get(metric)
+            current_value = metric_dict[metric]
+            if baseline_value and current_value is not None and current_value > baseline_value * (1 + tolerance):
+                regression_dict_list.append({'cassette': cassette_filename, 'metric': metric,
+                                             'baseline': baseline_value, 'current': current_value})
+
+    if update_baseline:
+        baseline_dict.update(current_dict)
+        with open(baseline_filename, 'w') as baseline_file:
+            json.dump(baseline_dict, baseline_file, indent=4, sort_keys=True)
+
+    return current_dict, regression_dict_list
+
+
+if __name__ == '__main__':
+    from optparse import OptionParser
+
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logger = logging.getLogger('siu_cassette')
+
+    script_usage = ''.join(['Usage: python %prog [options] CASSETTE_DIR\n'])
+    parser = OptionParser(usage=script_usage, version=__version__)
+    parser.add_option('-b', '--baseline', action='store', dest='baseline_filename', help='baseline results file [default: %default]', default='cassette_baseline.json')
+    parser.add_option('-s', '--speed', action='store', type='float', dest='speed', help='replay speed, 0 for no delays [default: %default]', default=0)
+    parser.add_option('-r', '--repeat', action='store', type='int', dest='repeat', help='runs per cassette, the best one is kept [default: %default]', default=3)
+    parser.add_option('-t', '--tolerance', action='store', type='float', dest='tolerance', help='allowed growth over the baseline [default: %default]', default=0.2)
+    parser.add_option('-u', '--update', action='store_true', dest='update_baseline', help='store the results as the new baseline [default: %default]', default=False)
+    parser.add_option('-l', '--log', action='store', dest='log_arg', help='logging level for the replayed sessions [default: %default]', default='critical')
+    parser.add_option('-m', '--log-mode', action='store', dest='log_mode', help='logger for the replayed sessions: standard buffered [default: %default]', default='standard')
+    (options, args) = parser.parse_args()
+
+    if len(args) != 1:
+        parser.error('A cassette directory is required')
+
+    # The session logs go to a temporary directory, so their cost is part of the measure
+    import shutil
+    import tempfile
+    from pysiu import siu_logger
+
+    session_log_dir = tempfile.mkdtemp()
+    session_log_level = getattr(logging, options.log_arg.upper(), logging.CRITICAL)
+    if options.log_mode == 'buffered':
+        session_logger = siu_logger.Buffered_Logger(session_log_dir, 'session.log', session_log_level)
+    else:
+        session_logger = logging.getLogger('siu_cassette.session')
+        session_logger.setLevel(session_log_level)
+        session_logger.propagate = False
+        session_logger.addHandler(logging.FileHandler(os.path.join(session_log_dir, 'session.log')))
+
+    current_dict, regression_dict_list = run_regression(args[0], options.baseline_filename, session_logger,
+                                                        options.speed, options.repeat, options.tolerance,
+                                                        options.update_baseline)
+
+    for cassette_filename, metric_dict in sorted(current_dict.items()):
+        logger.info('%-60s cpu %.4f sec  wall %.4f sec  peak alloc %s bytes (%s)' % (
+            cassette_filename, metric_dict['cpu_time'], metric_dict['wall_time'], metric_dict['peak_alloc'],
+            metric_dict['alloc_source']))
+
+    for regression_dict in regression_dict_list:
+        logger.error('REGRESSION %(cassette)s %(metric)s: %(baseline)s -> %(current)s' % regression_dict)
+
+    if options.log_mode == 'buffered':
+        session_logger.close()
+    shutil.rmtree(session_log_dir)
+
+    if regression_dict_list:
+        raise SystemExit(1)
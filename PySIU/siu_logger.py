@@ -0,0 +1,203 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+__author__ = 'Esteban Garcia-Gurtubay'
+__version__ = 'R13A01'
+__date__ = '19/10/2026 17:40:03'
+
+
+# Description     : A buffered logger for the multiprocess Workers, with one log file per Worker
+# Usage           : Build a Buffered_Logger in the master process and pass it to the Workers like any logger.
+#                   After the run, merge_log_files() merges the per-Worker files by timestamp
+#
+#                   Each record is a line in the per-Worker file:
+#                   2013-05-22 13:35:02.982256|12345|DEBUG|SIU5/session1|message
+#                   The backslashes and the newlines of the message are escaped as \\ and \n, so a record is always one line
+
+import datetime
+import glob
+import heapq
+import logging
+import multiprocessing.util
+import os
+import re
+import time
+import traceback
+
+
+# Constants
+ESCAPE_PATTERN = re.compile(r'\\(.)') # An escaped character in a record
+
+
+def escape_message(msg):
+    """Escape a message into a single line"""
+
+    return msg.replace('\\', '\\\\').replace('\n', '\\n')
+
+
+def unescape_message(msg, indent='    '):
+    """Undo escape_message(). The lines after the first one are indented"""
+
+    return ESCAPE_PATTERN.sub(lambda match: '\n' + indent if match.group(1) == 'n' else match.group(1), msg)
+
+
+class Buffered_Logger(object):
+    """A logger that keeps the records of each process in memory, and writes them in bulk to its own file
+
+    The records below level are discarded before any formatting. The records at forward_level or above are
+    also sent at once to forward_logger (e.g. an AppLogger for the console and the main log file).
+    The buffer is written when it holds buffer_size records, after flush_interval seconds, and when the
+    process exits (for multiprocessing Workers) or close() is called.
+
+    After a fork, the child process starts with an empty buffer and its own file, so the logger can be
+    created in the master and inherited by the Workers
+
+    Besides the usual logging methods, any other attribute (e.g. of an AppLogger) is taken from forward_logger
+    """
+
+    def __init__(self, log_dir, log_filename, level=logging.DEBUG, forward_logger=None, forward_level=logging.INFO,
+                 buffer_size=1000, flush_interval=5):
+        self.log_dir = log_dir
+        self.log_filename = log_filename
+        self.level = level
+        self.forward_logger = forward_logger
+        self.forward_level = forward_level
+        self.buffer_size = buffer_size
+        self.flush_interval = flush_interval
+        self.tag = '-'
+
+        if not os.path.exists(log_dir):
+            os.makedirs(log_dir)
+
+        self.reset()
+
+
+    def reset(self):
+        """Start an empty buffer for the current process"""
+
+        self.pid = os.getpid()
+        self.record_list = []
+        self.last_flush_time = time.time()
+        self.part_filename = os.path.join(self.log_dir, '%s.%i.part' % (self.log_filename, self.pid))
+
+        # Write the buffer when a multiprocessing Worker exits
+        multiprocessing.util.Finalize(self, self.flush, exitpriority=10)
+
+
+    def set_tag(self, tag):
+        """Set the tag of the next records, e.g. 'SIU5/session1'"""
+
+        self.tag = tag
+
+
+    def __getattr__(self, name):
+        # Only called for the attributes not defined here
+        forward_logger = self.__dict__.get('forward_logger')
+        if forward_logger is None:
+            raise AttributeError(name)
+        return getattr(forward_logger, name)
+
+
+    def isEnabledFor(self, level):
+        return level >= self.level
+
+
+    def log(self, level, msg='', *args):
+        if level < self.level:
+            return
+
+        if self.pid != os.getpid():
+            # We are in a forked process. Do not write the records of the parent process
+            self.reset()
+
+        if args:
+            msg = msg % args
+
+        # The timestamp always has microseconds, so the records sort by time as strings
+        self.record_list.append('%s|%i|%s|%s|%s\n' % (datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S.%f'), self.pid,
+                                                     logging.getLevelName(level), self.tag, escape_message(str(msg))))
+
+        if self.forward_logger is not None and level >= self.forward_level:
+            getattr(self.forward_logger, logging.getLevelName(level).lower())(msg)
+
+        if len(self.record_list) >= self.buffer_size or time.time() - self.last_flush_time > self.flush_interval:
+            self.flush()
+
+
+    def debug(self, msg='', *args):
+        self.log(logging.DEBUG, msg, *args)
+
+
+    def info(self, msg='', *args):
+        self.log(logging.INFO, msg, *args)
+
+
+    def warning(self, msg='', *args):
+        self.log(logging.WARNING, msg, *args)
+
+
+    warn = warning
+
+
+    def error(self, msg='', *args):
+        self.log(logging.ERROR, msg, *args)
+
+
+    def exception(self, msg='', *args):
+        """Log an error with the traceback of the exception being handled"""
+
+        if args:
+            msg = msg % args
+        self.log(logging.ERROR, '%s\n%s' % (msg, traceback.format_exc().rstrip('\n')))
+
+
+    def critical(self, msg='', *args):
+        self.log(logging.CRITICAL, msg, *args)
+
+
+    def flush(self):
+        """Write the buffered records of this process to its file"""
+
+        if self.pid != os.getpid():
+            return
+
+        if self.record_list:
+            with open(self.part_filename, 'a') as part_file:
+                part_file.write(''.join(self.record_list))
+            self.record_list = []
+        self.last_flush_time = time.time()
+
+
+    def close(self):
+        self.flush()
+
+
+    def get_part_filename_list(self):
+        """Return the per-Worker files of this log"""
+
+        return sorted(glob.glob(os.path.join(self.log_dir, '%s.*.part' % self.log_filename)))
+
+
+def merge_log_files(part_filename_list, merged_filename, remove_parts=True):
+    """Merge per-Worker log files into one file, ordered by timestamp. Return the number of records
+
+    Each part file is already in time order, so they are merged as streams, without loading them in memory
+    """
+
+    part_file_list = [open(part_filename) for part_filename in part_filename_list]
+    num_records = 0
+    try:
+        with open(merged_filename, 'a') as merged_file:
+            # The lines start with the timestamp, so they sort by time
+            for line in heapq.merge(*part_file_list):
+                merged_file.write(unescape_message(line))
+                num_records += 1
+    finally:
+        for part_file in part_file_list:
+            part_file.close()
+
+    if remove_parts:
+        for part_filename in part_filename_list:
+            os.remove(part_filename)
+
+    return num_records
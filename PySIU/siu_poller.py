@@ -0,0 +1,286 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+__author__ = 'Esteban Garcia-Gurtubay'
+__version__ = 'R13A01'
+__date__ = '19/10/2026 11:03:21'
+
+
+# Description     : Long-lived polling of SIU commands over persistent SSH sessions
+# Usage           : Build a SIU_Poller for a set of SIUs and call run(). It keeps one authenticated
+#                   shell per SIU, reconnects it on failure, and writes every sample to a sink
+# Note            : SIU_Wrapper uses SIGALRM for its timeouts, so each SIU_Poller must run in the main
+#                   thread of its own process. Split big SIU networks among several processes
+
+import datetime
+import heapq
+import json
+import signal
+import time
+
+from pysiu import siu_wrapper
+
+
+class JSON_Lines_Sink(object):
+    """A sample sink that appends every sample as a line of JSON to a local file"""
+
+    def __init__(self, filename):
+        self.filename = filename
+        self.sink_file = open(filename, 'a')
+
+
+    def write(self, sample_dict):
+        """Write a sample to the file, flushing it so it can be followed with tail -f"""
+
+        if bytes is str:
+            # Python 2. The SIU output is not always valid UTF-8
+            sample_line = json.dumps(sample_dict, encoding='ISO-8859-1')
+        else:
+            sample_line = json.dumps(sample_dict)
+
+        self.sink_file.write(sample_line + '\n')
+        self.sink_file.flush()
+
+
+    def close(self):
+        self.sink_file.close()
+
+
+class SIU_Poller(object):
+    """Poll a list of commands on a set of SIUs, keeping a persistent SSH session to each of them
+
+    The polls are spread evenly over poll_interval, e.g. 300 SIUs with poll_interval=300 means one SIU
+    polled per second. start_offset shifts the whole schedule, so several pollers can interleave.
+
+    With a scheduler, each open session holds a slot in its segment until it is closed, so MAX_SESSIONS caps
+    the sessions kept open on a segment. SIUs that find no free slot are retried later, like failed ones.
+    In a segment with more SIUs than MAX_SESSIONS, the sessions are not kept open: each poll waits up to
+    reconnect_delay for a slot, connects, runs the commands and closes the session, so all the SIUs take turns.
+
+    Each sample written to the sink is a siu_command_result_dict with some extra keys:
+    {'node', 'ip', 'sample_time', 'scheduled_time', 'cmd_string', 'cmd_success', 'cmd_data', ...}
+    """
+
+    def __init__(self, logger, siu_data_dict_list, siu_user, siu_password, command_list, sample_sink,
+                 poll_interval=300, start_offset=0, reconnect_delay=30, max_reconnect_delay=600, scheduler=None,
+                 debug_enabled=None):
+        self.logger = logger
+        self.siu_data_dict_list = siu_data_dict_list
+        self.siu_user = siu_user
+        self.siu_password = siu_password
+        self.command_list = command_list
+        self.sample_sink = sample_sink
+        self.poll_interval = float(poll_interval)
+        self.start_offset = float(start_offset)
+        self.reconnect_delay = float(reconnect_delay)
+        self.max_reconnect_delay = float(max_reconnect_delay)
+        self.scheduler = scheduler # An optional siu_scheduler.SIU_Scheduler to limit the open sessions and the (re)connections
+        self.debug_enabled = debug_enabled # Passed to SIU_Wrapper
+
+        self.running = False
+
+        # Per SIU state, indexed by siu_name
+        self.siuw_dict = {}
+        self.failure_count_dict = {}
+        self.slot_siu_data_dict = {} # SIUs holding a scheduler session slot
+
+
+    def stop_handler(self, signum, frame):
+        """A handler for UNIX signals, used to stop the polling loop"""
+
+        self.logger.info('Poller got signal %i. Stopping' % signum)
+        self.running = False
+
+
+    def connect(self, siu_data_dict):
+        """Open an authenticated shell to the SIU. Return True if the SIU prompt was received"""
+
+        siu_name = siu_data_dict['siu_name']
+        self.disconnect(siu_name)
+
+        if self.scheduler is not None:
+            if self.is_session_kept(siu_data_dict):
+                # The session keeps its slot in the segment while it is open. Do not wait for a free slot:
+                # the sessions of this same poller may be the ones holding them
+                slot_acquired = self.scheduler.acquire_session_slot(siu_data_dict, block=False)
+            else:
+                # The slots are only held during a poll, so one will be free soon
+                slot_acquired = self.scheduler.acquire_session_slot(siu_data_dict, timeout=self.reconnect_delay)
+
+            if not slot_acquired:
+                self.logger.warning('No free session slot in the segment of SIU %s' % siu_name)
+                return False
+            self.slot_siu_data_dict[siu_name] = siu_data_dict
+
+        siuw = siu_wrapper.SIU_Wrapper(self.logger, debug_enabled=self.debug_enabled)
+        siu_command_result_dict = siuw.SIU_login(siu_data_dict['siu_ip'], self.siu_user, self.siu_password)
+
+        if siu_command_result_dict['cmd_success']:
+            siu_command_result_dict = siuw.SIU_wait_for_prompt()
+
+        if not siu_command_result_dict['cmd_success']:
+            self.logger.error('Could not connect to SIU %s' % siu_name)
+            siuw.SIU_close_channel()
+            self.release_slot(siu_name)
+            return False
+
+        self.siuw_dict[siu_name] = siuw
+        return True
+
+
+    def is_session_kept(self, siu_data_dict):
+        """Check if the session to the SIU stays open between polls. Not in oversubscribed segments"""
+
+        if self.scheduler is None:
+            return True
+
+        return not self.scheduler.is_segment_oversubscribed(self.scheduler.get_segment(siu_data_dict))
+
+
+    def disconnect(self, siu_name):
+        """Close the session to the SIU, if any"""
+
+        siuw = self.siuw_dict.pop(siu_name, None)
+        if siuw is not None:
+            if siuw.SIU_is_connected():
+                siuw.SIU_exit()
+            else:
+                siuw.SIU_close_channel()
+
+        self.release_slot(siu_name)
+
+
+    def release_slot(self, siu_name):
+        """Give back the scheduler session slot of the SIU, if it holds one"""
+
+        siu_data_dict = self.slot_siu_data_dict.pop(siu_name, None)
+        if siu_data_dict is not None:
+            self.scheduler.release_session_slot(siu_data_dict)
+
+
+    def poll(self, siu_data_dict, scheduled_time):
+        """Run the command list on the SIU and write the samples to the sink
+
+        Return True if the session to the SIU is still usable
+        """
+
+        siu_name = siu_data_dict['siu_name']
+
+        siuw = self.siuw_dict.get(siu_name)
+        if siuw is None or not siuw.SIU_is_connected():
+            self.logger.info('Connecting to SIU %s' % siu_name)
+            if not self.connect(siu_data_dict):
+                return False
+            siuw = self.siuw_dict[siu_name]
+
+        # Run the commands one by one, to stop at the first communication failure
+        for command_string in self.command_list:
+            for siu_command_result_dict in siuw.SIU_run_command_list([command_string], self.siu_user):
+                siu_command_result_dict['node'] = siu_name
+                siu_command_result_dict['ip'] = siu_data_dict['siu_ip']
+                siu_command_result_dict['sample_time'] = str(datetime.datetime.now())
+                siu_command_result_dict['scheduled_time'] = str(datetime.datetime.fromtimestamp(scheduled_time))
+                try:
+                    self.sample_sink.write(siu_command_result_dict)
+                except Exception as e:
+                    # A bad sample must not stop the poller
+                    self.logger.error('Could not write sample for SIU %s, %s: %s' % (siu_name, command_string, str(e)))
+
+                # A communication failure (not a failed operation) leaves the session in an unknown state
+                siu_communication_dict = siu_command_result_dict.get('cmd_data', {})
+                if siu_communication_dict.get('comm_success') is False or not siuw.SIU_is_connected():
+                    self.logger.error('Communication failure with SIU %s' % siu_name)
+                    self.disconnect(siu_name)
+                    return False
+
+        if not self.is_session_kept(siu_data_dict):
+            # Give the slot to the next SIU of the segment
+            self.disconnect(siu_name)
+
+        return True
+
+
+    def get_retry_delay(self, siu_name):
+        """Return the delay until the next connection attempt, with exponential backoff"""
+
+        failure_count = self.failure_count_dict.get(siu_name, 0)
+        return min(self.reconnect_delay * 2 ** max(failure_count - 1, 0), self.max_reconnect_delay)
+
+
+    def get_next_slot(self, scheduled_time, after_time):
+        """Return the first poll time of the SIU schedule that is later than after_time
+
+        This keeps each SIU in its own slot, so the polls stay evenly spread over the poll interval
+        """
+
+        next_slot = scheduled_time + self.poll_interval
+        if next_slot < after_time:
+            next_slot += (int((after_time - next_slot) / self.poll_interval) + 1) * self.poll_interval
+        return next_slot
+
+
+    def run(self, max_cycles=None):
+        """Poll the SIUs until a SIGTERM/SIGINT is received, or after max_cycles poll attempts per SIU"""
+
+        self.running = True
+        signal.signal(signal.SIGTERM, self.stop_handler)
+        signal.signal(signal.SIGINT, self.stop_handler)
+
+        # Spread the first polls evenly over the poll interval
+        num_sius = len(self.siu_data_dict_list)
+        start_time = time.time() + self.start_offset
+        poll_queue = []
+        for index, siu_data_dict in enumerate(self.siu_data_dict_list):
+            first_poll_time = start_time + index * self.poll_interval / max(num_sius, 1)
+            heapq.heappush(poll_queue, (first_poll_time, index, 0))
+
+        self.logger.info('Polling %i SIU(s) every %.1f sec: %s' % (num_sius, self.poll_interval, self.command_list))
+
+        try:
+            while self.running and poll_queue:
+                scheduled_time, index, cycle = poll_queue[0]
+
+                now = time.time()
+                if scheduled_time > now:
+                    # Sleep in short steps, to react quickly to stop signals
+                    time.sleep(min(scheduled_time - now, 1.0))
+                    continue
+
+                heapq.heappop(poll_queue)
+                siu_data_dict = self.siu_data_dict_list[index]
+                siu_name = siu_data_dict['siu_name']
+
+                poll_success = self.poll(siu_data_dict, scheduled_time)
+
+                cycle += 1
+                if max_cycles is not None and cycle >= max_cycles:
+                    self.disconnect(siu_name)
+                    continue
+
+                if poll_success:
+                    self.failure_count_dict[siu_name] = 0
+
+                    # If we are late, skip the missed polls
+                    next_slot = self.get_next_slot(scheduled_time, time.time())
+                    if next_slot > scheduled_time + self.poll_interval:
+                        self.logger.warning('Polling is late for SIU %s. Skipping %i poll(s)' % (
+                            siu_name, int((next_slot - scheduled_time) / self.poll_interval) - 1))
+
+                else:
+                    self.failure_count_dict[siu_name] = self.failure_count_dict.get(siu_name, 0) + 1
+                    retry_delay = self.get_retry_delay(siu_name)
+                    next_slot = self.get_next_slot(scheduled_time, time.time() + retry_delay)
+                    self.logger.info('Retrying SIU %s in %.1f sec' % (siu_name, next_slot - time.time()))
+
+                heapq.heappush(poll_queue, (next_slot, index, cycle))
+
+        finally:
+            self.close()
+
+
+    def close(self):
+        """Close all the SIU sessions"""
+
+        for siu_name in list(self.siuw_dict):
+            self.disconnect(siu_name)
+        self.logger.info('Poller closed')
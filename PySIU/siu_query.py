@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+__author__ = 'Esteban Garcia-Gurtubay'
+__version__ = 'R13A01'
+__date__ = '19/10/2026 15:02:37'
+
+
+# Description     : Indexed store of the MO attribute values collected from the SIUs, and queries over it
+# Usage           : python siu_query.py -h
+#                   e.g. python siu_query.py ingest json/siu.getdata.results.*.json
+#                        python siu_query.py query -a diffServMinRateRelative_2 -o '!=' -v 200
+#                        python siu_query.py count -a diffServMinRateRelative_2
+
+import datetime
+import os
+import re
+import sqlite3
+from optparse import OptionParser
+
+from pysiu import siu_snapshot
+from pysiu import siu_spool
+
+# Constants
+QUERY_COMMAND_LIST = ['getmoattribute', 'dump'] # Only the output of these SIU commands is indexed
+QUERY_OPERATOR_LIST = ['=', '!=', '<', '>', '<=', '>=', 'like']
+RESULT_LINE_LIST = ['OperationSucceeded', 'OperationFailed']
+ATTRIBUTE_LINE_PATTERN = re.compile(r'^\s*([A-Za-z_][\w\-\.\[\]]*)\s*(?:[=:]\s*|\s+)(.*?)\s*$') # e.g. 'diffServMinRateRelative_2 200'
+
+SCHEMA_SQL = """
+CREATE TABLE IF NOT EXISTS ingested_file (
+    filename TEXT PRIMARY KEY,
+    size INTEGER,
+    mtime REAL,
+    ingest_time TEXT
+);
+CREATE TABLE IF NOT EXISTS session (
+    session_id INTEGER PRIMARY KEY,
+    node TEXT,
+    ip TEXT,
+    session_name TEXT,
+    session_time TEXT,
+    UNIQUE (node, session_name, session_time)
+);
+CREATE TABLE IF NOT EXISTS attribute_value (
+    session_id INTEGER,
+    node TEXT,
+    mo TEXT,
+    attribute TEXT,
+    value TEXT,
+    cmd_time TEXT
+);
+CREATE TABLE IF NOT EXISTS latest_value (
+    node TEXT,
+    mo TEXT,
+    attribute TEXT,
+    value TEXT,
+    cmd_time TEXT,
+    PRIMARY KEY (node, mo, attribute)
+);
+CREATE INDEX IF NOT EXISTS attribute_value_attribute_idx ON attribute_value (attribute, value);
+CREATE INDEX IF NOT EXISTS attribute_value_node_idx ON attribute_value (node, mo, attribute, cmd_time);
+CREATE INDEX IF NOT EXISTS latest_value_attribute_idx ON latest_value (attribute, value);
+CREATE INDEX IF NOT EXISTS latest_value_mo_idx ON latest_value (mo, attribute);
+"""
+
+
+def parse_MO_attributes(line_iterable, cmd_string):
+    """Parse the lines of a SIU response into tuples (mo, attribute, value)
+
+    e.g. for 'getMOAttribute STN=0,TrafficManager=QoS_WAN diffServMinRateRelative_2':
+    [('STN=0,TrafficManager=QoS_WAN', 'diffServMinRateRelative_2', '200')]
+
+    Only the indented attribute lines of a known MO are taken, plus the attributes requested in the command.
+    Other lines (errors, banners, warnings) are ignored
+    """
+
+    cmd_field_list = cmd_string.split()
+    requested_attribute_list = cmd_field_list[2:]
+
+    mo_attribute_list = []
+    for mo, line_list in siu_snapshot.split_MO_blocks(line_iterable, cmd_string):
+        if not mo:
+            # Lines outside any MO
+            continue
+
+        for line in line_list:
+            if line.strip() == '' or line.strip() in RESULT_LINE_LIST:
+                continue
+
+            if siu_snapshot.MO_HEADER_PATTERN.match(line):
+                # The MO header line itself
+                continue
+
+            match = ATTRIBUTE_LINE_PATTERN.match(line)
+            if match and (line[0].isspace() or match.group(1) in requested_attribute_list):
+                mo_attribute_list.append((mo, match.group(1), match.group(2)))
+            elif len(requested_attribute_list) == 1 and len(line.split()) == 1:
+                # When a single attribute is requested, the SIU may return its bare value
+                mo_attribute_list.append((mo, requested_attribute_list[0], line.strip()))
+
+    return mo_attribute_list
+
+
+def get_command_scope(cmd_string):
+    """Return the part of the node configuration that a command reads in full, as a tuple (mo, attribute_list)
+
+    mo is None for the whole node (dump), and an empty attribute_list means all the attributes of the MO.
+    Return None if the command does not read a known part
+    e.g. get_command_scope('getMOAttribute STN=0,TrafficManager=QoS_WAN diffServMinRateRelative_2') =
+         ('STN=0,TrafficManager=QoS_WAN', ['diffServMinRateRelative_2'])
+    """
+
+    cmd_field_list = cmd_string.split()
+    if cmd_field_list[0].lower() == 'dump':
+        return None, []
+
+    if cmd_field_list[0].lower() == 'getmoattribute' and len(cmd_field_list) > 1 and cmd_field_list[1].startswith('STN='):
+        return cmd_field_list[1], cmd_field_list[2:]
+
+    return None
+
+
+class Fleet_Store(object):
+    """An indexed SQLite store of the MO attribute values of the SIU network
+
+    Two tables can be queried: attribute_value, with every value ever ingested, and latest_value, with only
+    the latest value of each (node, mo, attribute). When a newer command result is ingested, the older
+    latest_value rows in the scope of the command are removed first (see get_command_scope()), so MOs and
+    attributes that are gone from the node are gone from latest_value too
+    """
+
+    def __init__(self, db_filename, logger):
+        self.db_filename = db_filename
+        self.logger = logger
+
+        self.connection = sqlite3.connect(db_filename)
+        self.connection.row_factory = sqlite3.Row
+        self.connection.executescript(SCHEMA_SQL)
+
+
+    def close(self):
+        self.connection.close()
+
+
+    def is_file_ingested(self, filename):
+        """Check if a results file was already ingested, and has not changed since then"""
+
+        file_stat = os.stat(filename)
+        row = self.connection.execute('SELECT size, mtime FROM ingested_file WHERE filename = ?',
+                                      (os.path.abspath(filename),)).fetchone()
+
+        return row is not None and row['size'] == file_stat.st_size and row['mtime'] == file_stat.st_mtime
+
+
+    def ingest_file(self, filename, force=False):
+        """Load a JSON results file into the store. Unchanged files and already known sessions are skipped
+
+        Return the number of attribute values ingested
+        """
+
+        if not force and self.is_file_ingested(filename):
+            self.logger.info('Skipping already ingested file %s' % filename)
+            return 0
+
+        file_stat = os.stat(filename)
+        num_values = self.ingest_session_results(siu_snapshot.load_session_result_dict_list(filename, self.logger))
+
+        with self.connection:
+            self.connection.execute('INSERT OR REPLACE INTO ingested_file (filename, size, mtime, ingest_time) VALUES (?, ?, ?, ?)',
+                                    (os.path.abspath(filename), file_stat.st_size, file_stat.st_mtime, str(datetime.datetime.now())))
+
+        self.logger.info('Ingested %i value(s) from %s' % (num_values, filename))
+        return num_values
+
+
+    def ingest_session_results(self, session_result_dict_list):
+        """Load a list of session_result_dicts into the store. Already known sessions are skipped
+
+        Samples from the polling daemon (one command per record) are also accepted, but only their
+        QUERY_COMMAND_LIST commands are indexed (not getcounters or getalarmlist).
+        Return the number of attribute values ingested
+        """
+
+        num_values = 0
+        with self.connection:
+            for session_result_dict in session_result_dict_list:
+                if 'session_data' in session_result_dict:
+                    session_name = session_result_dict.get('session_name', '')
+                    session_time = session_result_dict.get('session_time', '')
+                    siu_command_result_dict_list = session_result_dict['session_data']
+                else:
+                    # A poller sample
+                    session_name = 'poll'
+                    session_time = session_result_dict.get('sample_time', '')
+                    siu_command_result_dict_list = [session_result_dict]
+
+                node = session_result_dict.get('node', '')
+                cursor = self.connection.execute('INSERT OR IGNORE INTO session (node, ip, session_name, session_time) VALUES (?, ?, ?, ?)',
+                                                 (node, session_result_dict.get('ip', ''), session_name, session_time))
+                if cursor.rowcount == 0:
+                    # This session was ingested before
+                    continue
+                session_id = cursor.lastrowid
+
+                for siu_command_result_dict in siu_command_result_dict_list:
+                    cmd_string = siu_command_result_dict.get('cmd_string', '')
+                    if not cmd_string or cmd_string.split()[0].lower() not in QUERY_COMMAND_LIST:
+                        continue
+                    if not siu_snapshot.has_command_output(siu_command_result_dict):
+                        continue
+
+                    cmd_time = siu_command_result_dict.get('cmd_time', session_time)
+                    line_iterable = siu_spool.iter_comm_data(siu_command_result_dict['cmd_data'])
+                    row_list = [(session_id, node, mo, attribute, value, cmd_time)
+                                for mo, attribute, value in parse_MO_attributes(line_iterable, cmd_string)]
+
+                    self.connection.executemany('INSERT INTO attribute_value (session_id, node, mo, attribute, value, cmd_time) VALUES (?, ?, ?, ?, ?, ?)',
+                                                row_list)
+
+                    # Drop the older values that this command would have returned, had they still existed
+                    command_scope = get_command_scope(cmd_string)
+                    if command_scope is not None:
+                        self.delete_older_latest_values(node, cmd_time, *command_scope)
+
+                    # Keep only the newest value in latest_value
+                    self.connection.executemany('INSERT OR REPLACE INTO latest_value (node, mo, attribute, value, cmd_time) '
+                                                'SELECT ?, ?, ?, ?, ? WHERE NOT EXISTS '
+                                                '(SELECT 1 FROM latest_value WHERE node = ? AND mo = ? AND attribute = ? AND cmd_time > ?)',
+                                                [(node, mo, attribute, value, cmd_time, node, mo, attribute, cmd_time)
+                                                 for session_id, node, mo, attribute, value, cmd_time in row_list])
+                    num_values += len(row_list)
+
+        return num_values
+
+
+    def delete_older_latest_values(self, node, cmd_time, mo=None, attribute_list=None):
+        """Delete the latest_value rows of a node older than cmd_time, for one MO (and some attributes) or all"""
+
+        condition_list = ['node = ?', 'cmd_time < ?']
+        parameter_list = [node, cmd_time]
+        if mo is not None:
+            condition_list.append('mo = ?')
+            parameter_list.append(mo)
+        if attribute_list:
+            condition_list.append('attribute IN (%s)' % ', '.join(['?'] * len(attribute_list)))
+            parameter_list += attribute_list
+
+        self.connection.execute('DELETE FROM latest_value WHERE %s' % ' AND '.join(condition_list), parameter_list)
+
+
+    def build_where_clause(self, attribute=None, operator='=', value=None, mo=None, node=None):
+        """Return the tuple (where_sql, parameter_list) for the query filters. mo and node accept % wildcards"""
+
+        if operator not in QUERY_OPERATOR_LIST:
+            raise ValueError('Unknown query operator: %s' % operator)
+
+        condition_list = []
+        parameter_list = []
+        if attribute is not None:
+            condition_list.append('attribute = ?')
+            parameter_list.append(attribute)
+
+        if value is not None:
+            if operator in ('<', '>', '<=', '>='):
+                condition_list.append('CAST(value AS REAL) %s ?' % operator)
+                parameter_list.append(float(value))
+            else:
+                condition_list.append('value %s ?' % operator)
+                parameter_list.append(str(value))
+
+        if mo is not None:
+            condition_list.append('mo LIKE ?')
+            parameter_list.append(mo)
+
+        if node is not None:
+            condition_list.append('node LIKE ?')
+            parameter_list.append(node)
+
+        if condition_list:
+            return 'WHERE ' + ' AND '.join(condition_list), parameter_list
+        else:
+            return '', parameter_list
+
+
+    def query(self, attribute=None, operator='=', value=None, mo=None, node=None, history=False):
+        """Return the matching values as a list of dicts {'node', 'mo', 'attribute', 'value', 'cmd_time'}
+
+        e.g. query(attribute='diffServMinRateRelative_2', operator='!=', value='200')
+        Only the latest value of each node/MO/attribute is considered, unless history is True
+        """
+
+        where_sql, parameter_list = self.build_where_clause(attribute, operator, value, mo, node)
+        table = 'attribute_value' if history else 'latest_value'
+
+        cursor = self.connection.execute('SELECT node, mo, attribute, value, cmd_time FROM %s %s ORDER BY node, mo, attribute, cmd_time'
+                                         % (table, where_sql), parameter_list)
+        return [dict(zip(row.keys(), row)) for row in cursor]
+
+
+    def count_values(self, attribute, mo=None, node=None):
+        """Return the number of nodes per latest value of an attribute, as a list of tuples (value, count)
+
+        e.g. count_values('diffServMinRateRelative_2') = [('200', 9876), ('100', 12)]
+        """
+
+        where_sql, parameter_list = self.build_where_clause(attribute, mo=mo, node=node)
+
+        cursor = self.connection.execute('SELECT value, COUNT(DISTINCT node) FROM latest_value %s GROUP BY value ORDER BY 2 DESC'
+                                         % where_sql, parameter_list)
+        return [tuple(row) for row in cursor]
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logger = logging.getLogger('siu_query')
+
+    script_usage = ''.join(['Usage: python %prog [options] ingest JSON_RESULTS_FILE...\n',
+                            '       python %prog [options] query\n',
+                            '       python %prog [options] count\n'])
+    parser = OptionParser(usage=script_usage, version=__version__)
+    parser.add_option('-d', '--db', action='store', dest='db_filename', help='fleet store database file [default: %default]', default='siu_fleet.db')
+    parser.add_option('-a', '--attribute', action='store', dest='attribute', help='attribute name', default=None)
+    parser.add_option('-o', '--operator', action='store', dest='operator', help='comparison operator: %s [default: %%default]' % ' '.join(QUERY_OPERATOR_LIST), default='=')
+    parser.add_option('-v', '--value', action='store', dest='value', help='attribute value', default=None)
+    parser.add_option('-m', '--mo', action='store', dest='mo', help='MO LDN, with %% wildcards', default=None)
+    parser.add_option('-n', '--node', action='store', dest='node', help='node name, with %% wildcards', default=None)
+    parser.add_option('--history', action='store_true', dest='history', help='query all the ingested values, not only the latest ones [default: %default]', default=False)
+    parser.add_option('-f', '--force', action='store_true', dest='force', help='ingest files even if they were ingested before [default: %default]', default=False)
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.error('A command is required')
+
+    fleet_store = Fleet_Store(options.db_filename, logger)
+
+    if args[0] == 'ingest' and len(args) > 1:
+        for json_filename in args[1:]:
+            fleet_store.ingest_file(json_filename, force=options.force)
+
+    elif args[0] == 'query' and len(args) == 1:
+        for row_dict in fleet_store.query(options.attribute, options.operator, options.value,
+                                          options.mo, options.node, options.history):
+            logger.info('%(node)s  %(mo)s  %(attribute)s = %(value)s  [%(cmd_time)s]' % row_dict)
+
+    elif args[0] == 'count' and len(args) == 1 and options.attribute is not None:
+        for value, count in fleet_store.count_values(options.attribute, options.mo, options.node):
+            logger.info('%8i  %s' % (count, value))
+
+    else:
+        parser.error('Unknown command: %s' % ' '.join(args))
+
+    fleet_store.close()
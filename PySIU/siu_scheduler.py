@@ -0,0 +1,305 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+__author__ = 'Esteban Garcia-Gurtubay'
+__version__ = 'R13A01'
+__date__ = '19/10/2026 10:12:40'
+
+
+# Description     : Concurrency and rate limits for the SIU sessions, per network segment
+# Usage           : Build a SIU_Scheduler in the master process, before the Workers are forked,
+#                   so all the Workers share the same semaphores and token buckets
+
+import contextlib
+import multiprocessing
+import time
+
+from pysiu import oss_siu_data
+
+# Constants
+DEFAULT_SEGMENT = 'default' # For the SIUs with no usable SubNetwork nor IP address
+
+
+class Token_Bucket(object):
+    """A token bucket shared by all the processes forked after its creation
+
+    rate is the number of tokens added per second, burst the maximum number of tokens stored.
+    A rate of 0 means no limit
+    """
+
+    def __init__(self, rate, burst=None):
+        self.rate = float(rate)
+        if burst is None:
+            burst = max(self.rate, 1)
+        self.burst = float(max(burst, 1))
+
+        self.lock = multiprocessing.Lock()
+        self.tokens = multiprocessing.Value('d', self.burst, lock=False)
+        self.last_refill = multiprocessing.Value('d', time.time(), lock=False)
+
+
+    def consume(self, timeout=None):
+        """Take a token from the bucket, waiting until one is available or timeout
+
+        Return True if a token was taken, False on timeout
+        """
+
+        if self.rate <= 0:
+            return True
+
+        if timeout is not None:
+            deadline = time.time() + timeout
+
+        while True:
+            with self.lock:
+                now = time.time()
+                self.tokens.value = min(self.burst, self.tokens.value + (now - self.last_refill.value) * self.rate)
+                self.last_refill.value = now
+
+                if self.tokens.value >= 1:
+                    self.tokens.value -= 1
+                    return True
+
+                wait_time = (1 - self.tokens.value) / self.rate
+
+            if timeout is not None:
+                if time.time() + wait_time > deadline:
+                    return False
+            time.sleep(wait_time)
+
+
+class SIU_Scheduler(object):
+    """Limit the number of concurrent sessions and the session rate for each network segment,
+    and the rate of new SSH handshakes for the whole script
+
+    The segment of a SIU is the SEGMENT_LIMITS entry that matches its FDN (as a prefix) or its IP
+    (as a CIDR prefix). Otherwise, it is its FDN SubNetwork or its IP prefix, depending on SEGMENT_KEY.
+    SEGMENT_LIMITS entries should not overlap; if they do, the first one in sorted order is used.
+    SIUs with no SubNetwork in the FDN fall back to their IP prefix, and SIUs with no valid IP address
+    to DEFAULT_SEGMENT
+
+    scheduler_config_dict is the SIU_SCHEDULER section in config.yaml, e.g.
+    {'SSH_HANDSHAKES_PER_SECOND': 10,
+     'SEGMENT_KEY': 'subnetwork',
+     'IP_PREFIX_LENGTH': 24,
+     'MAX_SESSIONS_PER_SEGMENT': 0,
+     'SESSIONS_PER_SECOND_PER_SEGMENT': 0,
+     'SEGMENT_LIMITS': {'SubNetwork=ONRM_RootMo,SubNetwork=IPRAN': {'MAX_SESSIONS': 5, 'SESSIONS_PER_SECOND': 1},
+                        '10.1.6.0/24': {'MAX_SESSIONS': 2}},
+    }
+    """
+
+    def __init__(self, logger, scheduler_config_dict=None):
+        self.logger = logger
+
+        if scheduler_config_dict is None:
+            scheduler_config_dict = {}
+
+        self.segment_key = scheduler_config_dict.get('SEGMENT_KEY', 'subnetwork')
+        if self.segment_key not in ('subnetwork', 'ip_prefix'):
+            raise ValueError('Unknown SEGMENT_KEY: %s' % self.segment_key)
+
+        self.ip_prefix_length = int(scheduler_config_dict.get('IP_PREFIX_LENGTH', 24))
+        self.default_max_sessions = int(scheduler_config_dict.get('MAX_SESSIONS_PER_SEGMENT', 0))
+        self.default_sessions_per_second = float(scheduler_config_dict.get('SESSIONS_PER_SECOND_PER_SEGMENT', 0))
+        self.segment_limits_dict = scheduler_config_dict.get('SEGMENT_LIMITS') or {}
+
+        self.handshake_bucket = Token_Bucket(scheduler_config_dict.get('SSH_HANDSHAKES_PER_SECOND', 0))
+
+        # Per segment semaphores and token buckets. They must be created before forking the Workers
+        self.segment_semaphore_dict = {}
+        self.segment_bucket_dict = {}
+        self.segment_max_sessions_dict = {}
+        self.segment_siu_count_dict = {}
+
+
+    def add_SIUs(self, siu_data_dict_list):
+        """Create the limits for the segments of the given SIUs {'siu_name', 'siu_ip', 'siu_fdn'}
+
+        This must be called in the master process, before the Workers are launched
+        """
+
+        for siu_data_dict in siu_data_dict_list:
+            segment = self.get_segment(siu_data_dict)
+            if segment == DEFAULT_SEGMENT:
+                self.logger.warning('SIU %s has no SubNetwork nor valid IP address. Using segment %s' % (
+                    siu_data_dict.get('siu_name'), DEFAULT_SEGMENT))
+
+            self.segment_siu_count_dict[segment] = self.segment_siu_count_dict.get(segment, 0) + 1
+            if segment in self.segment_semaphore_dict:
+                continue
+
+            max_sessions, sessions_per_second = self.get_segment_limits(segment)
+            self.segment_max_sessions_dict[segment] = max_sessions
+            if max_sessions > 0:
+                self.segment_semaphore_dict[segment] = multiprocessing.BoundedSemaphore(max_sessions)
+            else:
+                self.segment_semaphore_dict[segment] = None
+
+            if sessions_per_second > 0:
+                self.segment_bucket_dict[segment] = Token_Bucket(sessions_per_second)
+            else:
+                self.segment_bucket_dict[segment] = None
+
+            self.logger.info('Segment %s: max sessions %s, sessions per second %s' % (
+                segment, max_sessions or 'unlimited', sessions_per_second or 'unlimited'))
+
+        for segment, siu_count in sorted(self.segment_siu_count_dict.items()):
+            if self.is_segment_oversubscribed(segment):
+                self.logger.warning('Segment %s has more SIUs (%i) than sessions (%i). Its SIUs will wait for their turn' % (
+                    segment, siu_count, self.segment_max_sessions_dict[segment]))
+
+
+    def is_segment_oversubscribed(self, segment):
+        """Check if the segment has more SIUs (in add_SIUs()) than its max number of sessions"""
+
+        max_sessions = self.segment_max_sessions_dict.get(segment, 0)
+        return max_sessions > 0 and self.segment_siu_count_dict.get(segment, 0) > max_sessions
+
+
+    def get_segment(self, siu_data_dict):
+        """Return the segment name for the given SIU {'siu_name', 'siu_ip', 'siu_fdn'}
+
+        e.g. 'SubNetwork=ONRM_RootMo,SubNetwork=IPRAN', '10.1.6.0/24' or DEFAULT_SEGMENT
+        """
+
+        siu_fdn = siu_data_dict.get('siu_fdn') or ''
+        siu_ip = siu_data_dict.get('siu_ip') or ''
+        is_ip_valid = oss_siu_data.is_ip_valid(siu_ip)
+
+        for segment in sorted(self.segment_limits_dict):
+            if '/' in segment:
+                if is_ip_valid and is_ip_in_prefix(siu_ip, segment):
+                    return segment
+            elif siu_fdn == segment or siu_fdn.startswith(segment + ','):
+                return segment
+
+        if self.segment_key == 'subnetwork':
+            subnetwork = get_subnetwork(siu_fdn)
+            if subnetwork:
+                return subnetwork
+
+        if is_ip_valid:
+            return get_ip_prefix(siu_ip, self.ip_prefix_length)
+
+        return DEFAULT_SEGMENT
+
+
+    def get_segment_limits(self, segment):
+        """Return the tuple (max_sessions, sessions_per_second) for the given segment. 0 means no limit"""
+
+        segment_limits = self.segment_limits_dict.get(segment) or {}
+        max_sessions = int(segment_limits.get('MAX_SESSIONS', self.default_max_sessions))
+        sessions_per_second = float(segment_limits.get('SESSIONS_PER_SECOND', self.default_sessions_per_second))
+
+        return max_sessions, sessions_per_second
+
+
+    def wait_for_handshake(self):
+        """Wait until a new SSH handshake is allowed by the global rate limit"""
+
+        self.handshake_bucket.consume()
+
+
+    def acquire_session_slot(self, siu_data_dict, block=True, timeout=None):
+        """Take a session slot in the segment of the SIU, then wait for the segment and handshake rate limits
+
+        Return False if the segment has no free slot, at once if block is False, or after timeout seconds.
+        Every successful call must be paired with a release_session_slot()
+        """
+
+        segment = self.get_segment(siu_data_dict)
+        if segment not in self.segment_semaphore_dict:
+            # Not registered with add_SIUs(). Only the global handshake limit applies
+            self.logger.warning('Segment %s has no limits defined' % segment)
+
+        semaphore = self.segment_semaphore_dict.get(segment)
+        bucket = self.segment_bucket_dict.get(segment)
+
+        if semaphore is not None:
+            self.logger.debug('Waiting for a session slot in segment %s' % segment)
+            if not semaphore.acquire(block, timeout):
+                return False
+        try:
+            if bucket is not None:
+                bucket.consume()
+            self.wait_for_handshake()
+
+        except:
+            if semaphore is not None:
+                semaphore.release()
+            raise
+
+        return True
+
+
+    def release_session_slot(self, siu_data_dict):
+        """Give back the session slot taken with acquire_session_slot()"""
+
+        semaphore = self.segment_semaphore_dict.get(self.get_segment(siu_data_dict))
+        if semaphore is not None:
+            semaphore.release()
+
+
+    @contextlib.contextmanager
+    def session_slot(self, siu_data_dict):
+        """Context manager to run a SIU session within the limits of its segment
+
+        e.g.
+        with scheduler.session_slot(siu_data_dict):
+            siuw.SIU_login(...)
+        """
+
+        self.acquire_session_slot(siu_data_dict)
+        try:
+            yield self.get_segment(siu_data_dict)
+
+        finally:
+            self.release_session_slot(siu_data_dict)
+
+
+def get_subnetwork(siu_fdn):
+    """Return the SubNetwork part of a SIU FDN
+
+    e.g.:
+    get_subnetwork('SubNetwork=ONRM_RootMo,SubNetwork=IPRAN,ManagedElement=SIU5') = 'SubNetwork=ONRM_RootMo,SubNetwork=IPRAN'
+    """
+
+    return ','.join([rdn for rdn in siu_fdn.split(',') if rdn.startswith('SubNetwork=')])
+
+
+def ip_to_int(ip_address):
+    """Convert a dotted IP address into an integer"""
+
+    value = 0
+    for octet in ip_address.split('.'):
+        value = (value << 8) + int(octet)
+    return value
+
+
+def int_to_ip(value):
+    """Convert an integer into a dotted IP address"""
+
+    return '.'.join([str((value >> shift) & 0xff) for shift in (24, 16, 8, 0)])
+
+
+def get_ip_prefix(ip_address, prefix_length):
+    """Return the CIDR prefix that contains the IP address
+
+    e.g.:
+    get_ip_prefix('10.1.6.29', 24) = '10.1.6.0/24'
+    """
+
+    mask = (0xffffffff << (32 - prefix_length)) & 0xffffffff
+    return '%s/%i' % (int_to_ip(ip_to_int(ip_address) & mask), prefix_length)
+
+
+def is_ip_in_prefix(ip_address, cidr_prefix):
+    """Check if the IP address belongs to the CIDR prefix
+
+    e.g.:
+    is_ip_in_prefix('10.1.6.29', '10.1.0.0/16') = True
+    """
+
+    network, prefix_length = cidr_prefix.split('/')
+    return get_ip_prefix(ip_address, int(prefix_length)) == get_ip_prefix(network, int(prefix_length))
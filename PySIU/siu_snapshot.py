@@ -0,0 +1,386 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+__author__ = 'Esteban Garcia-Gurtubay'
+__version__ = 'R13A01'
+__date__ = '19/10/2026 13:41:52'
+
+
+# Description     : Deduplicated storage of SIU configuration snapshots (dump -l, getMOAttribute...)
+# Usage           : python siu_snapshot.py -h
+#                   The outputs are split in per-MO blocks, and each unique block is stored only once,
+#                   keyed by its content hash. Each node/run only keeps a manifest of block hashes.
+#
+#                   <store_dir>/blocks/ab/ab12cd...       One file per unique block
+#                   <store_dir>/manifests/<run_id>/<node>.json
+
+import difflib
+import hashlib
+import json
+import os
+import re
+import tempfile
+from optparse import OptionParser
+
+from pysiu import siu_spool
+
+# Constants
+SNAPSHOT_COMMAND_LIST = ['dump', 'getmoattribute'] # Only the output of these SIU commands is stored
+SIU_PROMPT_LIST = ['OSmon> ', '[root]# ']
+MO_HEADER_PATTERN = re.compile(r'^(STN=\S+)') # e.g. STN=0,EthernetInterface=1
+
+
+def split_MO_blocks(line_iterable, cmd_string):
+    """Split the lines of a SIU response in per-MO blocks. Yield tuples (mo, line_list)
+
+    A block starts at each line beginning with an MO LDN (e.g. STN=0,EthernetInterface=1). The lines before the
+    first MO belong to the MO given in the command, if any (e.g. getMOAttribute STN=0 ...), or to ''.
+    The echoed command and the SIU prompts are dropped
+    """
+
+    cmd_field_list = cmd_string.split()
+    if len(cmd_field_list) > 1 and cmd_field_list[1].startswith('STN='):
+        mo = cmd_field_list[1]
+    else:
+        mo = ''
+
+    line_list = []
+    for line in line_iterable:
+        if line.strip() == cmd_string.strip():
+            # The echo of our command
+            continue
+
+        if any([line.startswith(siu_prompt) for siu_prompt in SIU_PROMPT_LIST]):
+            continue
+
+        match = MO_HEADER_PATTERN.match(line)
+        if match and match.group(1) != mo:
+            if line_list:
+                yield mo, line_list
+            mo = match.group(1)
+            line_list = []
+
+        line_list.append(line)
+
+    if line_list:
+        yield mo, line_list
+
+
+def has_command_output(siu_command_result_dict):
+    """Check if a command got a complete response from the SIU
+
+    cmd_success is None when the prompt came back without OperationSucceeded, as for dump -l.
+    That output is still usable. Only real failures are rejected
+    """
+
+    if siu_command_result_dict.get('cmd_success') is False:
+        return False
+
+    siu_communication_dict = siu_command_result_dict.get('cmd_data')
+    return isinstance(siu_communication_dict, dict) and siu_communication_dict.get('comm_success') is True
+
+
+def get_block_hash(line_list):
+    """Return the content hash of a block of lines"""
+
+    block_data = '\n'.join(line_list)
+    if not isinstance(block_data, bytes):
+        block_data = block_data.encode('utf-8')
+    return hashlib.sha1(block_data).hexdigest()
+
+
+class Snapshot_Store(object):
+    """A content-addressed store of SIU configuration snapshots
+
+    A manifest is a dict {'node', 'run_id', 'commands': {cmd_string: [[mo, block_hash], ...]}}
+    """
+
+    def __init__(self, store_dir, logger, snapshot_command_list=None):
+        self.store_dir = store_dir
+        self.logger = logger
+        if snapshot_command_list is None:
+            snapshot_command_list = SNAPSHOT_COMMAND_LIST
+        self.snapshot_command_list = snapshot_command_list
+
+        self.block_dir = os.path.join(store_dir, 'blocks')
+        self.manifest_dir = os.path.join(store_dir, 'manifests')
+
+        for directory in (self.block_dir, self.manifest_dir):
+            make_dirs(directory)
+
+
+    def get_block_filename(self, block_hash):
+        return os.path.join(self.block_dir, block_hash[:2], block_hash)
+
+
+    def store_block(self, line_list):
+        """Store a block of lines, if it is not in the store already. Return its hash"""
+
+        block_hash = get_block_hash(line_list)
+        block_filename = self.get_block_filename(block_hash)
+
+        if not os.path.exists(block_filename):
+            write_file_atomically(block_filename, '\n'.join(line_list))
+
+        return block_hash
+
+
+    def load_block(self, block_hash):
+        """Return the lines of a stored block"""
+
+        with open(self.get_block_filename(block_hash)) as block_file:
+            return block_file.read().split('\n')
+
+
+    def add_session_results(self, session_result_dict_list, run_id):
+        """Store the snapshot commands found in the session results, as run run_id
+
+        The sessions of the same node are merged in one manifest. Return the number of manifests written
+        """
+
+        manifest_dict = {}
+        for session_result_dict in session_result_dict_list:
+            node = session_result_dict['node']
+            manifest = manifest_dict.setdefault(node, {'node': node, 'run_id': run_id, 'commands': {}})
+
+            for siu_command_result_dict in session_result_dict.get('session_data', []):
+                cmd_string = siu_command_result_dict.get('cmd_string', '')
+                if not cmd_string or cmd_string.split()[0].lower() not in self.snapshot_command_list:
+                    continue
+
+                if not has_command_output(siu_command_result_dict):
+                    self.logger.info('Not storing failed command for %s: %s' % (node, cmd_string))
+                    continue
+
+                block_list = []
+                mo_count_dict = {}
+                line_iterable = siu_spool.iter_comm_data(siu_command_result_dict['cmd_data'])
+                for mo, line_list in split_MO_blocks(line_iterable, cmd_string):
+                    # The same MO may appear more than once in an output
+                    mo_count_dict[mo] = mo_count_dict.get(mo, 0) + 1
+                    if mo_count_dict[mo] > 1:
+                        mo = '%s#%i' % (mo, mo_count_dict[mo])
+                    block_list.append([mo, self.store_block(line_list)])
+
+                manifest['commands'][cmd_string] = block_list
+
+        for node, manifest in manifest_dict.items():
+            if manifest['commands']:
+                self.write_manifest(manifest)
+
+        return len([manifest for manifest in manifest_dict.values() if manifest['commands']])
+
+
+    def get_manifest_filename(self, run_id, node):
+        return os.path.join(self.manifest_dir, run_id, '%s.json' % node)
+
+
+    def write_manifest(self, manifest):
+        make_dirs(os.path.join(self.manifest_dir, manifest['run_id']))
+        write_file_atomically(self.get_manifest_filename(manifest['run_id'], manifest['node']),
+                              json.dumps(manifest, sort_keys=True))
+
+
+    def get_manifest(self, run_id, node):
+        """Return the manifest of a node in a run, or None if the node was not stored in that run"""
+
+        manifest_filename = self.get_manifest_filename(run_id, node)
+        if not os.path.exists(manifest_filename):
+            return None
+
+        with open(manifest_filename) as manifest_file:
+            return json.load(manifest_file)
+
+
+    def get_run_id_list(self):
+        """Return the sorted list of stored runs
+
+        Run IDs should sort by time, e.g. '20130522_133502' (time.strftime('%Y%m%d_%H%M%S'))
+        """
+
+        return sorted(os.listdir(self.manifest_dir))
+
+
+    def get_node_list(self, run_id):
+        """Return the sorted list of nodes stored in a run"""
+
+        run_dir = os.path.join(self.manifest_dir, run_id)
+        if not os.path.isdir(run_dir):
+            return []
+
+        return sorted([filename[:-len('.json')] for filename in os.listdir(run_dir) if filename.endswith('.json')])
+
+
+    def diff_node(self, node, old_run_id, new_run_id, with_lines=True):
+        """Return the changes of a node between two runs, as a list of dicts
+        {'cmd_string', 'mo', 'change': 'added'|'removed'|'changed', 'diff': [unified diff lines]}
+
+        Only the commands stored in both runs are compared. A node or a command that was not collected in
+        one of the runs (e.g. the SIU was unreachable, or the command failed) is not a removal. It is reported
+        as {'cmd_string', 'mo': '', 'change': 'not collected', 'run_id'}, with cmd_string '' for the whole node.
+
+        Only the hashes in the manifests are compared. The blocks are read only to build the diff lines
+        """
+
+        old_manifest = self.get_manifest(old_run_id, node)
+        new_manifest = self.get_manifest(new_run_id, node)
+
+        if old_manifest is None or new_manifest is None:
+            if old_manifest is None and new_manifest is None:
+                return []
+            return [{'cmd_string': '', 'mo': '', 'change': 'not collected',
+                     'run_id': old_run_id if old_manifest is None else new_run_id}]
+
+        change_dict_list = []
+        for cmd_string in sorted(set(old_manifest['commands']) | set(new_manifest['commands'])):
+            if cmd_string not in old_manifest['commands'] or cmd_string not in new_manifest['commands']:
+                change_dict_list.append({'cmd_string': cmd_string, 'mo': '', 'change': 'not collected',
+                                         'run_id': old_run_id if cmd_string not in old_manifest['commands'] else new_run_id})
+                continue
+
+            old_block_dict = dict(old_manifest['commands'][cmd_string])
+            new_block_dict = dict(new_manifest['commands'][cmd_string])
+
+            for mo in sorted(set(old_block_dict) | set(new_block_dict)):
+                old_hash = old_block_dict.get(mo)
+                new_hash = new_block_dict.get(mo)
+                if old_hash == new_hash:
+                    continue
+
+                if old_hash is None:
+                    change = 'added'
+                elif new_hash is None:
+                    change = 'removed'
+                else:
+                    change = 'changed'
+
+                change_dict = {'cmd_string': cmd_string, 'mo': mo, 'change': change}
+                if with_lines:
+                    old_line_list = self.load_block(old_hash) if old_hash else []
+                    new_line_list = self.load_block(new_hash) if new_hash else []
+                    change_dict['diff'] = list(difflib.unified_diff(old_line_list, new_line_list,
+                                                                    old_run_id, new_run_id, lineterm=''))
+                change_dict_list.append(change_dict)
+
+        return change_dict_list
+
+
+    def diff_run(self, old_run_id, new_run_id, with_lines=False):
+        """Return the changes of all the nodes between two runs, as a dict {node: change_dict_list}
+
+        Unchanged nodes are not included
+        """
+
+        diff_dict = {}
+        for node in sorted(set(self.get_node_list(old_run_id)) | set(self.get_node_list(new_run_id))):
+            change_dict_list = self.diff_node(node, old_run_id, new_run_id, with_lines)
+            if change_dict_list:
+                diff_dict[node] = change_dict_list
+
+        return diff_dict
+
+
+def make_dirs(directory):
+    """Create a directory tree, tolerating other Workers creating it at the same time"""
+
+    if not os.path.exists(directory):
+        try:
+            os.makedirs(directory)
+        except OSError:
+            if not os.path.isdir(directory):
+                raise
+
+
+def write_file_atomically(filename, data):
+    """Write a file through a temporary file and a rename, so readers never see a partial file"""
+
+    directory = os.path.dirname(filename)
+    make_dirs(directory)
+    file_descriptor, tmp_filename = tempfile.mkstemp(dir=directory)
+    with os.fdopen(file_descriptor, 'w') as tmp_file:
+        tmp_file.write(data)
+    os.rename(tmp_filename, filename)
+
+
+def load_session_result_dict_list(json_filename, logger=None):
+    """Load the session results from a JSON results file
+
+    The file may hold one or more concatenated JSON documents, each being a session_result_dict
+    or a list of them, e.g. the poller sample files (one document per line).
+    An incomplete last line, as in a sample file still being written, is skipped
+    """
+
+    with open(json_filename) as json_file:
+        data = json_file.read()
+
+    decoder = json.JSONDecoder()
+    session_result_dict_list = []
+    position = 0
+    while True:
+        # Skip the whitespace between documents
+        while position < len(data) and data[position].isspace():
+            position += 1
+        if position >= len(data):
+            break
+
+        try:
+            document, position = decoder.raw_decode(data, position)
+        except ValueError:
+            if '\n' in data[position:].rstrip():
+                raise
+
+            if logger is not None:
+                logger.warning('Skipping incomplete last line of %s' % json_filename)
+            break
+
+        if isinstance(document, dict):
+            session_result_dict_list.append(document)
+        else:
+            session_result_dict_list += document
+
+    return session_result_dict_list
+
+
+if __name__ == '__main__':
+    import logging
+    logging.basicConfig(level=logging.INFO, format='%(message)s')
+    logger = logging.getLogger('siu_snapshot')
+
+    script_usage = ''.join(['Usage: python %prog [options] add JSON_RESULTS_FILE RUN_ID    (e.g. RUN_ID 20130522_133502)\n',
+                            '       python %prog [options] runs\n',
+                            '       python %prog [options] diff OLD_RUN_ID NEW_RUN_ID [NODE]\n'])
+    parser = OptionParser(usage=script_usage, version=__version__)
+    parser.add_option('-d', '--store-dir', action='store', dest='store_dir', help='snapshot store directory [default: %default]', default='snapshots')
+    (options, args) = parser.parse_args()
+
+    if not args:
+        parser.error('A command is required')
+
+    snapshot_store = Snapshot_Store(options.store_dir, logger)
+
+    if args[0] == 'add' and len(args) == 3:
+        num_manifests = snapshot_store.add_session_results(load_session_result_dict_list(args[1]), args[2])
+        logger.info('Stored %i node(s) in run %s' % (num_manifests, args[2]))
+
+    elif args[0] == 'runs' and len(args) == 1:
+        for run_id in snapshot_store.get_run_id_list():
+            logger.info(run_id)
+
+    elif args[0] == 'diff' and len(args) in (3, 4):
+        if len(args) == 4:
+            diff_dict = {args[3]: snapshot_store.diff_node(args[3], args[1], args[2])}
+        else:
+            diff_dict = snapshot_store.diff_run(args[1], args[2])
+
+        for node, change_dict_list in sorted(diff_dict.items()):
+            for change_dict in change_dict_list:
+                if change_dict['change'] == 'not collected':
+                    logger.info('%s not collected in %s [%s]' % (node, change_dict['run_id'], change_dict['cmd_string'] or 'all commands'))
+                    continue
+
+                logger.info('%s %s [%s] %s' % (node, change_dict['change'], change_dict['cmd_string'], change_dict['mo']))
+                for diff_line in change_dict.get('diff', []):
+                    logger.info('    %s' % diff_line)
+
+    else:
+        parser.error('Unknown command: %s' % ' '.join(args))
@@ -0,0 +1,75 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+__author__ = 'Esteban Garcia-Gurtubay'
+__version__ = 'R13A01'
+__date__ = '19/10/2026 12:20:05'
+
+
+# Description     : Helpers for the SIU responses spooled to disk by SIU_Wrapper
+# Usage           : The session results only hold a reference to each spooled response. Use these helpers
+#                   to move the spool files next to the JSON results, or to get the full response back
+
+import os
+import shutil
+
+
+def get_spooled_communication_dict_list(session_result_dict_list):
+    """Return the siu_communication_result_dicts that reference a spool file, in the given session results"""
+
+    siu_communication_dict_list = []
+    for session_result_dict in session_result_dict_list:
+        for siu_command_result_dict in session_result_dict.get('session_data', []):
+            siu_communication_dict = siu_command_result_dict.get('cmd_data')
+            if isinstance(siu_communication_dict, dict) and siu_communication_dict.get('comm_spool_file'):
+                siu_communication_dict_list.append(siu_communication_dict)
+
+    return siu_communication_dict_list
+
+
+def link_spool_files(session_result_dict_list, dest_dir, logger):
+    """Move the spool files referenced in the session results to dest_dir, updating the references
+
+    A hard link is used when possible, so no data is copied. Otherwise the file is copied, without
+    loading it in memory
+    """
+
+    if not os.path.exists(dest_dir):
+        try:
+            os.makedirs(dest_dir)
+        except OSError:
+            # Another Worker may have created it meanwhile
+            if not os.path.isdir(dest_dir):
+                raise
+
+    for siu_communication_dict in get_spooled_communication_dict_list(session_result_dict_list):
+        spool_filename = siu_communication_dict['comm_spool_file']
+        dest_filename = os.path.join(dest_dir, os.path.basename(spool_filename))
+        if os.path.abspath(spool_filename) == os.path.abspath(dest_filename):
+            continue
+
+        try:
+            os.link(spool_filename, dest_filename)
+        except (OSError, AttributeError):
+            # Different file systems, or no hard links in this OS
+            shutil.copyfile(spool_filename, dest_filename)
+        os.remove(spool_filename)
+
+        logger.debug('Spool file %s moved to %s' % (spool_filename, dest_filename))
+        siu_communication_dict['comm_spool_file'] = dest_filename
+
+
+def iter_comm_data(siu_communication_dict):
+    """Iterate over the lines of a SIU response, reading them from the spool file if it was spooled"""
+
+    spool_filename = siu_communication_dict.get('comm_spool_file')
+    if spool_filename:
+        with open(spool_filename) as spool_file:
+            for line in spool_file:
+                yield line.rstrip('\r\n')
+    else:
+        comm_data = siu_communication_dict.get('comm_data') or []
+        if not isinstance(comm_data, list):
+            comm_data = comm_data.splitlines()
+        for line in comm_data:
+            yield line
@@ -9,17 +9,75 @@ __date__ = '19/06/2013 17:07:15'
 # Description     : A wrapper library to interact with SIU nodes
 
 import datetime
+import logging
+import os
 import pprint
 import signal
 import time
 import paramiko
 
+from pysiu import siu_cassette
+
 
 class SIU_Wrapper(object):
-    """A set of wrapping functions to interact with a single SIU"""
+    """A set of wrapping functions to interact with a single SIU
+
+    If spool_dir is given, responses bigger than spool_threshold bytes are streamed to a spool file
+    in that directory instead of being kept in memory. See SIU_read_response()
+
+    If record_dir is given, the shell channel of each session is recorded into a cassette file in that
+    directory. If replay_cassette is given, no SSH connection is made: the channel is fed from the
+    cassette file at replay_speed (0 means no delays). See siu_cassette
 
-    def __init__(self, logger):
+    debug_enabled tells if the debug messages are logged, so they are not formatted for nothing. If it is
+    not given, it is taken from the logger when possible (see is_debug_enabled()). Otherwise the debug
+    messages are formatted, as always. Pass debug_enabled=False to skip them
+    """
+
+    def __init__(self, logger, spool_dir=None, spool_threshold=1048576, spool_preview_size=4096,
+                 record_dir=None, replay_cassette=None, replay_speed=1.0, debug_enabled=None):
         self.logger = logger
+        if debug_enabled is None:
+            debug_enabled = self.is_debug_enabled()
+        self.debug_enabled = debug_enabled
+        self.ssh = None
+        self.chan = None
+        self.siu_ip = None
+
+        if spool_dir is not None and spool_threshold < 2 * spool_preview_size:
+            # Otherwise the head and the tail previews of a spooled response would overlap
+            raise ValueError('spool_threshold (%i) must be at least twice spool_preview_size (%i)' % (spool_threshold, spool_preview_size))
+
+        self.spool_dir = spool_dir
+        self.spool_threshold = spool_threshold
+        self.spool_preview_size = spool_preview_size # Bytes kept in memory from the head and the tail of a spooled response
+        self.spool_count = 0
+
+        self.record_dir = record_dir
+        self.cassette_count = 0
+        self.replay_cassette = replay_cassette
+        self.replay_speed = replay_speed
+
+
+    def is_debug_enabled(self):
+        """Check if the logger keeps debug messages, so they are not formatted for nothing
+
+        Standard loggers tell it with isEnabledFor(). Loggers wrapping one (e.g. AppLogger) are checked through
+        their logger attribute, or their numeric level/log_level. If the logger cannot tell, return True
+        """
+
+        for logger in (self.logger, getattr(self.logger, 'logger', None)):
+            is_enabled_for = getattr(logger, 'isEnabledFor', None)
+            if is_enabled_for is not None:
+                return is_enabled_for(logging.DEBUG)
+
+        for level_attribute in ('level', 'log_level'):
+            level = getattr(self.logger, level_attribute, None)
+            if isinstance(level, int):
+                return level <= logging.DEBUG
+
+        # The logger cannot tell. Keep the debug messages
+        return True
 
 
     def signal_handler(self, signum, frame):
@@ -33,8 +91,7 @@ class SIU_Wrapper(object):
         """Login into the given SIU with an SSH session"""
 
         self.chan = None
-        self.ssh = paramiko.SSHClient()
-        self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+        self.siu_ip = siu_ip
 
         siu_communication_result_dict = {}
         siu_communication_result_dict['comm_time'] = self.get_timestamp()
@@ -44,6 +101,17 @@ class SIU_Wrapper(object):
         siu_command_result_dict['cmd_string'] = 'ssh login'
         siu_command_result_dict['cmd_time'] = self.get_timestamp()
 
+        if self.replay_cassette is not None:
+            self.logger.info('Replaying SIU session from %s' % self.replay_cassette)
+            self.chan = siu_cassette.Replay_Channel(self.replay_cassette, self.replay_speed, self.logger)
+            siu_communication_result_dict['comm_success'] = True
+            siu_command_result_dict['cmd_success'] = True
+            siu_command_result_dict['cmd_data'] = siu_communication_result_dict
+            return siu_command_result_dict
+
+        self.ssh = paramiko.SSHClient()
+        self.ssh.set_missing_host_key_policy(paramiko.AutoAddPolicy())
+
         self.logger.info('Login into SIU %s' % siu_ip)
         try:
             # Sometimes the SSH connection to a SIU hangs forever, even from command line.
@@ -60,6 +128,9 @@ class SIU_Wrapper(object):
             self.chan = self.ssh.invoke_shell()
             self.logger.info('Got SIU shell')
 
+            if self.record_dir is not None:
+                self.chan = siu_cassette.Recording_Channel(self.chan, self.get_cassette_filename(), siu_ip, siu_user)
+
         except IOError as e:
             siu_communication_result_dict['comm_success'] = False
             siu_communication_result_dict['comm_error'] = 'IOError while connecting to SIU'
@@ -129,7 +200,8 @@ class SIU_Wrapper(object):
         success_status = None
 
         self.chan.settimeout(timeout) # Timeout for the channel
-        self.logger.debug('> Sending to SIU: %s' % str(cmd.splitlines()))
+        if self.debug_enabled:
+            self.logger.debug('> Sending to SIU: %s' % str(cmd.splitlines()))
 
         try:
             # Set an extra timeout with UNIX signals
@@ -150,7 +222,8 @@ class SIU_Wrapper(object):
             success_status = False
 
         else:
-            self.logger.debug('< Sending done')
+            if self.debug_enabled:
+                self.logger.debug('< Sending done')
             success_status = True
 
         finally:
@@ -165,10 +238,18 @@ class SIU_Wrapper(object):
          or timeout
 
         Return a siu_communication_result_dict with info about the OSS/SIU data exchange
+
+        When spooling is enabled and the response grows over spool_threshold, the response is written to a
+        spool file as it is received. Then comm_data only holds a preview (the head and the tail of the
+        response), and the dict gets two extra keys: comm_spool_file (full path) and comm_spool_size (bytes)
         """
 
-        self.logger.debug('> Waiting response from SIU. Valid responses are: %s' % expected_response_list)
+        if self.debug_enabled:
+            self.logger.debug('> Waiting response from SIU. Valid responses are: %s' % expected_response_list)
         input_buffer = ''
+        spool_file = None
+        spool_head = ''
+        spool_size = 0
         siu_communication_result_dict = {}
         siu_communication_result_dict['comm_success'] = None
         siu_communication_result_dict['comm_time'] = self.get_timestamp()
@@ -188,12 +269,38 @@ class SIU_Wrapper(object):
                 input_buffer += self.chan.recv(1)
                 ##self.logger.debug(' Input_buffer: %s' % str(input_buffer.splitlines()))
 
+                if self.spool_dir is not None:
+                    if spool_file is None and len(input_buffer) > self.spool_threshold:
+                        # The response is too big to be kept in memory. Move it to a spool file
+                        spool_file = self.open_spool_file()
+                        siu_communication_result_dict['comm_spool_file'] = spool_file.name
+                        spool_head = input_buffer[:self.spool_preview_size]
+                        spool_data = input_buffer[:-self.spool_preview_size]
+                        spool_file.write(spool_data)
+                        spool_size += len(spool_data)
+                        input_buffer = input_buffer[-self.spool_preview_size:]
+
+                    elif spool_file is not None and len(input_buffer) >= 2 * self.spool_preview_size:
+                        # Only the tail of the response is kept in memory, to look for the expected patterns
+                        spool_data = input_buffer[:-self.spool_preview_size]
+                        spool_file.write(spool_data)
+                        spool_size += len(spool_data)
+                        input_buffer = input_buffer[-self.spool_preview_size:]
+
                 # Examine the buffer for expected patterns
                 for expected_response in expected_response_list:
                     if expected_response in input_buffer:
                         siu_communication_result_dict['comm_success'] = True # To exit the loop
-                        siu_communication_result_dict['comm_data'] = input_buffer.splitlines()
-                        self.logger.debug('< Found a match in the response: [\'%s\']' % str(expected_response))
+                        if spool_file is None:
+                            siu_communication_result_dict['comm_data'] = input_buffer.splitlines()
+                        else:
+                            # Drop the partial first line of the tail in the preview
+                            siu_communication_result_dict['comm_data'] = (
+                                spool_head.splitlines()[:-1] +
+                                ['... [response spooled to %s] ...' % spool_file.name] +
+                                input_buffer.splitlines()[1:])
+                        if self.debug_enabled:
+                            self.logger.debug('< Found a match in the response: [\'%s\']' % str(expected_response))
 
         except IOError as e:
             siu_communication_result_dict['comm_success'] = False
@@ -211,9 +318,57 @@ class SIU_Wrapper(object):
             # Disable the UNIX timeout signal
             signal.alarm(0)
 
+            if spool_file is not None:
+                # Whatever was received until now goes to the spool file
+                spool_file.write(input_buffer)
+                spool_size += len(input_buffer)
+                spool_file.close()
+                siu_communication_result_dict['comm_spool_size'] = spool_size
+                if self.debug_enabled:
+                    self.logger.debug('< Response spooled to %s (%i bytes)' % (spool_file.name, spool_size))
+
         return siu_communication_result_dict
 
 
+    def open_spool_file(self):
+        """Open a new spool file for a SIU response
+
+        e.g. <spool_dir>/10.1.6.29.20130522_133502.12345.1.txt
+        """
+
+        if not os.path.exists(self.spool_dir):
+            try:
+                os.makedirs(self.spool_dir)
+            except OSError:
+                # Another Worker may have created it meanwhile
+                if not os.path.isdir(self.spool_dir):
+                    raise
+
+        self.spool_count += 1
+        spool_filename = '%s.%s.%i.%i.txt' % (self.siu_ip, time.strftime('%Y%m%d_%H%M%S'), os.getpid(), self.spool_count)
+        return open(os.path.join(self.spool_dir, spool_filename), 'w')
+
+
+    def get_cassette_filename(self):
+        """Return the full path of a new cassette file for this session, creating record_dir if needed
+
+        e.g. <record_dir>/10.1.6.29.20130522_133502.12345.1.cassette
+        """
+
+        if not os.path.exists(self.record_dir):
+            try:
+                os.makedirs(self.record_dir)
+            except OSError:
+                # Another Worker may have created it meanwhile
+                if not os.path.isdir(self.record_dir):
+                    raise
+
+        self.cassette_count += 1
+        cassette_filename = '%s.%s.%i.%i%s' % (self.siu_ip, time.strftime('%Y%m%d_%H%M%S'), os.getpid(), self.cassette_count,
+                                               siu_cassette.CASSETTE_EXTENSION)
+        return os.path.join(self.record_dir, cassette_filename)
+
+
     def SIU_send_command(self, command_string, error_msg=None, expected_response_list=['OSmon> '], timeout=15):
         """Send the given command_string to the SIU, return a siu_command_result_dict
 
@@ -274,9 +429,10 @@ class SIU_Wrapper(object):
                 siu_command_result_dict['cmd_error'] = 'Response error. Timeout maybe?'
                 siu_command_result_dict['cmd_data'] = siu_communication_dict
 
-        self.logger.debug('siu_command_result_dict:')
-        self.logger.debug(pprint.pformat(siu_command_result_dict))
-        self.logger.debug('')
+        if self.debug_enabled:
+            self.logger.debug('siu_command_result_dict:')
+            self.logger.debug(pprint.pformat(siu_command_result_dict))
+            self.logger.debug('')
 
         return siu_command_result_dict
 
@@ -382,11 +538,28 @@ class SIU_Wrapper(object):
 
 
     def SIU_close_channel(self):
-        """Close the underlyng SSH channel"""
+        """Close the underlyng SSH channel and its SSH connection"""
 
         if self.chan is not None:
             self.chan.close()
 
+        if self.ssh is not None:
+            self.ssh.close()
+
+
+    def SIU_is_connected(self):
+        """Check if the SSH shell channel to the SIU is still usable"""
+
+        if self.chan is None or self.chan.closed:
+            return False
+
+        if self.ssh is None:
+            # A replayed session
+            return True
+
+        transport = self.ssh.get_transport()
+        return transport is not None and transport.is_active()
+
 
     def get_timestamp(self):
         """Return a timestamp
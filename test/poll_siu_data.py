@@ -0,0 +1,193 @@
+#!/usr/bin/env python
+# coding=utf-8
+
+__author__ = 'Esteban Garcia-Gurtubay'
+__version__ = 'R13A01'
+__date__ = '19/10/2026 11:03:21'
+
+
+# Description     : Long-lived daemon that polls commands (e.g. getcounters, getalarmlist) on the SIUs,
+#                   keeping the SSH sessions open between polls. Samples are written as JSON lines.
+# Usage           : python poll_siu_data.py -h
+# Note            : It has to be run within a proper virtualenv. Stop it with SIGTERM or Ctrl-C
+
+
+import logging.handlers
+import multiprocessing
+import os
+import pprint
+import signal
+import socket
+import sys
+import time
+from optparse import OptionParser
+import yaml
+
+from pyoss import app_logger
+from pyoss import oss_utils
+
+from pysiu import oss_siu_data
+from pysiu import siu_poller
+from pysiu import siu_scheduler as siu_scheduler_lib
+
+
+SIU_USER = 'some_username' # Replace the real username here
+SIU_PASSWORD = 'some_password' # Replace the real password here
+
+
+def poll_worker(worker_index, siu_data_dict_list, start_offset, sample_filename):
+    """Poll a slice of the SIU network, in its own process"""
+
+    sample_sink = siu_poller.JSON_Lines_Sink(sample_filename)
+    poller = siu_poller.SIU_Poller(logger, siu_data_dict_list, SIU_USER, SIU_PASSWORD,
+                                   poller_config_dict.get('COMMAND_LIST', ['getcounters', 'getalarmlist']),
+                                   sample_sink,
+                                   poll_interval=poll_interval,
+                                   start_offset=start_offset,
+                                   reconnect_delay=poller_config_dict.get('RECONNECT_DELAY', 30),
+                                   max_reconnect_delay=poller_config_dict.get('MAX_RECONNECT_DELAY', 600),
+                                   scheduler=siu_scheduler,
+                                   debug_enabled=(log_level <= logging.DEBUG))
+    logger.info('Poller %i started with %i SIU(s). Samples go to %s' % (worker_index, len(siu_data_dict_list), sample_filename))
+    try:
+        poller.run()
+    finally:
+        sample_sink.close()
+
+
+def stop_handler(signum, frame):
+    """Forward the stop signal to the poller processes"""
+
+    logger.info('Got signal %i. Stopping the pollers' % signum)
+    for process in process_list:
+        if process.is_alive():
+            os.kill(process.pid, signal.SIGTERM)
+
+
+#-----------------------------------------------------------------------------
+# Constants
+POSSIBLE_LOG_LEVELS = {'debug': logging.DEBUG,
+                       'info': logging.INFO,
+                       'warning': logging.WARNING,
+                       'error': logging.ERROR,
+                       'critical': logging.CRITICAL}
+
+# Directory names constants
+LOG = 'log'
+CONFIG = 'etc'
+JSON = 'json'
+
+
+# Filename constants
+CONFIG_FILENAME = 'config.yaml'
+
+# Runtime values
+script_name = os.path.basename(sys.argv[0]).split('.')[0]
+script_usage = ''.join(['Usage: python %prog [options]\n'])
+script_path = sys.argv[0]
+
+
+# Parse the command line options
+parser = OptionParser(usage=script_usage, version=__version__)
+parser.add_option('-s', '--silent', action='store_true', dest='silent', help='do not print messages to screen [default: %default]', default=False)
+parser.add_option('-l', '--log', action='store', dest='log_arg', help='set logging level: info debug warning error critical [default: %default]', default='info')
+
+(options, args) = parser.parse_args()
+log_level = POSSIBLE_LOG_LEVELS.get(options.log_arg, logging.INFO)
+
+
+# Record the initial time
+start_time = time.time()
+now = time.localtime()
+full_timestamp_suffix = time.strftime("%d%b%Y_%H%M%S", now)
+
+
+# Build the solution directory path
+solution_dir = os.path.abspath(os.path.join(script_path, '..'))
+
+
+# Build the log dir and file
+log_dir = os.path.join(solution_dir, LOG)
+log_filename = '%s.log' % script_name
+
+
+# Build the configuration directory path
+config_dir = os.path.join(solution_dir, CONFIG)
+
+
+# Build the config file dirname
+configfile_full_pathname = os.path.join(config_dir, CONFIG_FILENAME)
+
+
+# Build JSON dir
+json_dir = os.path.join(solution_dir, JSON)
+if not os.path.exists(json_dir):
+    os.makedirs(json_dir)
+
+
+# Instantiate a logger object
+logger = app_logger.AppLogger(log_dir, log_filename, log_level, log_tag=script_name, silent_console=options.silent)
+logger.info('-' * 80)
+logger.info('Starting %s.py %s at %s' % (script_name, __version__, full_timestamp_suffix))
+logger.info()
+
+
+# Check if the invoking user belongs to an authorized Unix group
+oss_utils.is_user_group_allowed(['nms', 'staff'], logger)
+
+
+# Check if this script instance is the only one running
+oss_utils.is_instance_unique(os.path.basename(__file__), logger)
+
+
+# Read parameters from the config file
+logger.info('Reading configuration file: %s' % configfile_full_pathname)
+with open(configfile_full_pathname) as config_file:
+    config_dict = yaml.load(config_file)
+logger.debug(pprint.pformat(config_dict))
+
+
+siu_fdn_black_list = config_dict.get('SIU_BLACK_LIST', [])
+poller_config_dict = config_dict.get('SIU_POLLER', {})
+poll_interval = float(poller_config_dict.get('POLL_INTERVAL', 300))
+num_workers = poller_config_dict.get('NUM_WORKERS', 8)
+process_list = []
+
+
+# The SIU discovery is done only once, when the daemon starts
+siu_fdn_list = oss_siu_data.get_SIU_fdn_list_from_SMO(logger, siu_fdn_black_list=siu_fdn_black_list)
+
+if siu_fdn_list == []:
+    logger.info('No SIU nodes were found in this OSS!')
+
+else:
+    siu_data_dict_list = oss_siu_data.get_SIU_data(siu_fdn_list, logger, ping_check=False)
+
+    # The reconnections are limited by the scheduler, like in a normal run
+    siu_scheduler = siu_scheduler_lib.SIU_Scheduler(logger, config_dict.get('SIU_SCHEDULER'))
+    siu_scheduler.add_SIUs(siu_data_dict_list)
+
+    # Deal the SIUs round robin to the pollers. With an offset per poller, the polls of the whole
+    # SIU network are spread evenly over the poll interval
+    num_workers = max(1, min(num_workers, len(siu_data_dict_list)))
+    oss_hostname = socket.gethostname()
+    for worker_index in range(num_workers):
+        worker_siu_data_dict_list = siu_data_dict_list[worker_index::num_workers]
+        start_offset = worker_index * poll_interval / len(siu_data_dict_list)
+        sample_filename = os.path.join(json_dir, 'siu.poll.samples.%s.%s.%i.jsonl' % (oss_hostname, full_timestamp_suffix, worker_index))
+
+        process = multiprocessing.Process(target=poll_worker,
+                                          args=(worker_index, worker_siu_data_dict_list, start_offset, sample_filename))
+        process.start()
+        process_list.append(process)
+
+    signal.signal(signal.SIGTERM, stop_handler)
+    signal.signal(signal.SIGINT, stop_handler)
+
+    for process in process_list:
+        process.join()
+
+
+# Exit
+duration = time.time() - start_time
+logger.info('Completed %s.py %s in %.4f sec - Bye!\n' % (script_name, __version__, duration))
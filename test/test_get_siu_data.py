@@ -26,6 +26,10 @@ from pyoss import oss_utils
 from pyoss import multiprocess_jobs
 
 from pysiu import oss_siu_data
+from pysiu import siu_logger
+from pysiu import siu_scheduler as siu_scheduler_lib
+from pysiu import siu_snapshot
+from pysiu import siu_spool
 from pysiu import siu_wrapper
 
 
@@ -70,9 +74,14 @@ def callback_function(siu_data_dict, logger):
         siu_name = siu_data_dict['siu_name']
         siu_ip = siu_data_dict['siu_ip']
 
+        if hasattr(logger, 'set_tag'):
+            # Buffered logging. Tag the records of this session
+            logger.set_tag('%s/%s' % (siu_name, session_id))
         logger.info('Launching for SIU %s job %s as %s' % (siu_name, session_id, siu_user))
 
-        siuw = siu_wrapper.SIU_Wrapper(logger)
+        # Big responses (e.g. dump -l) are streamed to a spool file instead of being kept in memory
+        siuw = siu_wrapper.SIU_Wrapper(logger, spool_dir=spool_dir, spool_threshold=spool_threshold, record_dir=cassette_dir,
+                                       debug_enabled=siu_debug_enabled)
 
         # Initialize session_result_dict
         session_result_dict = {
@@ -85,25 +94,34 @@ def callback_function(siu_data_dict, logger):
             'session_data':[],
         }
 
-        siu_command_result_dict = siuw.SIU_login(siu_ip, siu_user, siu_password)
-        session_result_dict['session_data'].append(siu_command_result_dict)
-
-        if siu_command_result_dict['cmd_success']:
-            # Login ok
-            siu_command_result_dict = siuw.SIU_wait_for_prompt()
+        # Wait for a free slot in the SIU network segment, within the configured rate limits
+        with siu_scheduler.session_slot(siu_data_dict):
+            siu_command_result_dict = siuw.SIU_login(siu_ip, siu_user, siu_password)
             session_result_dict['session_data'].append(siu_command_result_dict)
 
             if siu_command_result_dict['cmd_success']:
-                # Got the prompt again. Start sending useful commands to the SIU
-                siu_command_result_dict_list = siuw.SIU_run_command_list(siu_command_list, siu_user)
-                session_result_dict['session_data'] += siu_command_result_dict_list
+                # Login ok
+                siu_command_result_dict = siuw.SIU_wait_for_prompt()
+                session_result_dict['session_data'].append(siu_command_result_dict)
+
+                if siu_command_result_dict['cmd_success']:
+                    # Got the prompt again. Start sending useful commands to the SIU
+                    siu_command_result_dict_list = siuw.SIU_run_command_list(siu_command_list, siu_user)
+                    session_result_dict['session_data'] += siu_command_result_dict_list
 
-            # Close the SSH connection
-            siuw.SIU_exit()
+                # Close the SSH connection
+                siuw.SIU_exit()
 
         # Store this session's result
         session_result_dict_list.append(session_result_dict)
 
+    # Move the spooled responses next to the JSON results. The JSON file only holds their references
+    siu_spool.link_spool_files(session_result_dict_list, json_spool_dir, logger)
+
+    # Keep a deduplicated snapshot of the configuration outputs (dump -l, getMOAttribute)
+    if snapshot_store is not None:
+        snapshot_store.add_session_results(session_result_dict_list, snapshot_run_id)
+
     return session_result_dict_list
 
 
@@ -134,15 +152,18 @@ script_path = sys.argv[0]
 parser = OptionParser(usage=script_usage, version=__version__)
 parser.add_option('-s', '--silent', action='store_true', dest='silent', help='do not print messages to screen [default: %default]', default=False)
 parser.add_option('-l', '--log', action='store', dest='log_arg', help='set logging level: info debug warning error critical [default: %default]', default='info')
+parser.add_option('-b', '--buffered-debug', action='store_true', dest='buffered_debug', help='keep a debug log of the Workers, buffered per Worker and merged at the end [default: %default]', default=False)
 
 (options, args) = parser.parse_args()
 log_level = POSSIBLE_LOG_LEVELS.get(options.log_arg, logging.INFO)
+siu_debug_enabled = options.buffered_debug or log_level <= logging.DEBUG # Explicit, whatever AppLogger tells SIU_Wrapper
 
 
 # Record the initial time
 start_time = time.time()
 now = time.localtime()
 full_timestamp_suffix = time.strftime("%d%b%Y_%H%M%S", now)
+snapshot_run_id = time.strftime("%Y%m%d_%H%M%S", now) # Sorts by time, unlike full_timestamp_suffix
 
 
 # Build the solution directory path
@@ -192,6 +213,19 @@ logger.debug(pprint.pformat(config_dict))
 
 siu_fdn_black_list = config_dict.get('SIU_BLACK_LIST', [])
 siu_base_fdn = config_dict['SIU_BASE_FDN']
+num_workers = config_dict.get('NUM_WORKERS', 40)
+spool_dir = config_dict.get('SPOOL_DIR', '/var/tmp/pysiu_spool')
+spool_threshold = config_dict.get('SPOOL_THRESHOLD', 1048576)
+cassette_dir = config_dict.get('CASSETTE_DIR')
+
+
+# Instantiate the snapshot store, if one is configured
+if config_dict.get('SNAPSHOT_DIR'):
+    snapshot_dir = os.path.join(solution_dir, config_dict['SNAPSHOT_DIR'])
+    logger.info('Storing configuration snapshots in %s' % snapshot_dir)
+    snapshot_store = siu_snapshot.Snapshot_Store(snapshot_dir, logger)
+else:
+    snapshot_store = None
 
 
 # Log the SIU blacklist
@@ -217,13 +251,33 @@ else:
     # Get the connection information for the list of SIUs as a list of dicts {'siu_name', 'siu_ip'}
     siu_data_dict_list = oss_siu_data.get_SIU_data(siu_fdn_list, logger, ping_check=False)
 
+    # Set the per segment session limits. This must be done before launching the Workers,
+    # so they all share the same limits
+    siu_scheduler = siu_scheduler_lib.SIU_Scheduler(logger, config_dict.get('SIU_SCHEDULER'))
+    siu_scheduler.add_SIUs(siu_data_dict_list)
+
     # Define a file to store the SIU sessions results in JSON format
     oss_hostname = socket.gethostname()
     json_dump_full_filename = os.path.join(json_dir, 'siu.getdata.results.%s.%s.json' % (oss_hostname, full_timestamp_suffix))
+    json_spool_dir = os.path.join(json_dir, 'siu.getdata.spool.%s.%s' % (oss_hostname, full_timestamp_suffix))
 
     # Create and launch multiple processes for the SIU jobs
-    multiprocess_jobs.Multiprocess_Master(json_dump_full_filename, logger, siu_data_dict_list,
-                                          callback_function,num_workers=40)
+    if options.buffered_debug:
+        # Each Worker buffers its debug records in memory and writes them in bulk to its own file.
+        # The records at the normal logging level still go to the main logger at once
+        worker_logger = siu_logger.Buffered_Logger(log_dir, '%s.debug.log' % script_name, logging.DEBUG,
+                                                   forward_logger=logger, forward_level=max(log_level, logging.INFO))
+    else:
+        worker_logger = logger
+
+    multiprocess_jobs.Multiprocess_Master(json_dump_full_filename, worker_logger, siu_data_dict_list,
+                                          callback_function, num_workers=num_workers)
+
+    if options.buffered_debug:
+        worker_logger.close()
+        debug_log_filename = os.path.join(log_dir, '%s.debug.log' % script_name)
+        num_records = siu_logger.merge_log_files(worker_logger.get_part_filename_list(), debug_log_filename)
+        logger.info('Merged %i debug record(s) into %s' % (num_records, debug_log_filename))
 
     ## If not using multiprocess, do this
     # import json